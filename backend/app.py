@@ -1,17 +1,135 @@
 """
 水果蔬菜采购管理系统 - 后端主文件
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from datetime import datetime
+import io
 import json
+import os
+import re
+import uuid
+
+from archive import ColdStore, archive_orders, ArchiveError, DEFAULT_MAX_AGE_DAYS, FINAL_STATUSES
+from importer import detect_format, import_orders, ImportFormatError
+from jobs import JobManager, JobError, JobLimitError, RESULT_MIMETYPES, public_job
+from price_index import check_price, ANOMALY_MIN_SAMPLES, ANOMALY_ZSCORE
+from replication import Follower
+from store import create_store, MemoryStore, SORT_FIELDS
+from timing import init_app as init_timing, phase
+from validation import build_order, validate_changes, ValidationError
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Request-ID', 'Server-Timing', 'X-Replication-Seq'])
+init_timing(app)
 
-# ==================== 模拟数据 ====================
+# ==================== 数据存储 ====================
+# 默认使用进程内存储；生产模式（serve.py）通过 PURCHASE_STORE 指定共享的 SQLite 存储
+# 设置 PURCHASE_REPLICA_OF 时作为只读副本运行，追踪主节点的变更流
 PURCHASE_ORDERS = []
-ORDER_COUNTER = 1000
+REPLICA = None
+if os.environ.get('PURCHASE_REPLICA_OF'):
+    REPLICA = Follower(
+        os.environ['PURCHASE_REPLICA_OF'].replace('sqlite:///', '', 1),
+        MemoryStore(PURCHASE_ORDERS)
+    ).start()
+    STORE = REPLICA.store
+else:
+    STORE = create_store(orders=PURCHASE_ORDERS)
+
+# 冷存储：已归档的终态采购单，只在请求带 include_archived=1 时查询
+app.config.setdefault(
+    'ARCHIVE_DIR',
+    os.environ.get('PURCHASE_ARCHIVE_DIR')
+    or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'archive')
+)
+COLD = ColdStore(app.config['ARCHIVE_DIR'])
+
+# 批量导入报告目录
+app.config.setdefault(
+    'IMPORT_REPORT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'imports')
+)
+
+# 后台报表任务：进程池执行，结果缓存在磁盘上
+# serve.py 设置 PURCHASE_JOB_RUNNER=external，由独立的执行器进程运行任务，worker 只负责写入任务队列
+app.config.setdefault(
+    'JOB_DIR',
+    os.environ.get('PURCHASE_JOB_DIR')
+    or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs')
+)
+JOBS = JobManager(
+    app.config['JOB_DIR'],
+    max_workers=int(os.environ.get('PURCHASE_JOB_WORKERS', 2)),
+    max_active=int(os.environ.get('PURCHASE_JOB_MAX_ACTIVE', 4)),
+    ttl=int(os.environ.get('PURCHASE_JOB_TTL', 3600)),
+    run_jobs=os.environ.get('PURCHASE_JOB_RUNNER') != 'external'
+)
+
+# 单价异常检测，默认关闭，也可以在创建请求中通过 price_check=1 单独开启
+app.config.setdefault('PRICE_ANOMALY_CHECK', os.environ.get('PRICE_ANOMALY_CHECK') == '1')
+app.config.setdefault('PRICE_ANOMALY_ZSCORE', ANOMALY_ZSCORE)
+
+# 副本等待追上 min_seq 的最长时间（秒）
+app.config.setdefault('REPLICA_WAIT_TIMEOUT', 2.0)
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+@app.before_request
+def enforce_replica_consistency():
+    """副本拒绝写请求；请求带 min_seq 时等待副本应用到该序号（read-your-writes）"""
+    if REPLICA is None:
+        return None
+    
+    # 报表任务只读取数据，可以在副本上执行
+    if request.method in WRITE_METHODS and not request.path.startswith('/api/jobs'):
+        return jsonify({
+            'code': 403,
+            'message': '只读副本不接受写请求，请发送到主节点',
+            'data': None
+        }), 403
+    
+    min_seq = request.args.get('min_seq') or request.headers.get('X-Min-Seq')
+    if not min_seq:
+        return None
+    try:
+        min_seq = int(min_seq)
+    except ValueError:
+        return jsonify({
+            'code': 400,
+            'message': '参数验证失败: min_seq 必须为整数',
+            'data': None
+        }), 400
+    if not REPLICA.wait_for(min_seq, app.config['REPLICA_WAIT_TIMEOUT']):
+        response = jsonify({
+            'code': 503,
+            'message': f'副本尚未同步到序号 {min_seq}',
+            'data': REPLICA.status()
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
+
+
+@app.after_request
+def add_replication_seq(response):
+    """副本返回已应用的序号；主节点在写请求后返回最新序号，客户端可据此在副本上读到自己的写入"""
+    if REPLICA is not None:
+        response.headers['X-Replication-Seq'] = str(REPLICA.applied_seq)
+    elif request.method in WRITE_METHODS:
+        head = STORE.head_seq()
+        if head is not None:
+            response.headers['X-Replication-Seq'] = str(head)
+    return response
+
+
+def check_order_price(order):
+    """优先与同供应商的历史单价比较，样本不足时与该产品全部供应商比较"""
+    stats = STORE.price_stats(order['product_name'], order['supplier_name'])
+    if stats is None or stats.count < ANOMALY_MIN_SAMPLES:
+        stats = STORE.price_stats(order['product_name'])
+    return check_price(stats, order['unit_price'], app.config['PRICE_ANOMALY_ZSCORE'])
 
 
 # ==================== API 路由 ====================
@@ -28,66 +146,35 @@ def create_purchase_order():
         "unit_price": 10.5,
         "category": "蔬菜" or "水果"
     }
+    Query Parameters:
+    - price_check: 1 开启单价异常检测，偏离历史分布时返回 price_alert（可选）
     """
     try:
-        global ORDER_COUNTER
-        
         data = request.get_json()
         
         # 数据验证
-        if not data:
-            return jsonify({
-                'code': 400,
-                'message': '请求体不能为空',
-                'data': None
-            }), 400
-        
-        required_fields = ['supplier_name', 'product_name', 'quantity', 'unit_price', 'category']
-        missing_fields = [field for field in required_fields if field not in data or data[field] is None]
-        
-        if missing_fields:
-            return jsonify({
-                'code': 400,
-                'message': f'缺少必需字段: {", ".join(missing_fields)}',
-                'data': None
-            }), 400
-        
-        # 参数验证
         try:
-            quantity = int(data['quantity'])
-            unit_price = float(data['unit_price'])
-            
-            if quantity <= 0:
-                raise ValueError('数量必须大于0')
-            if unit_price < 0:
-                raise ValueError('单价不能为负数')
-        except (ValueError, TypeError) as e:
+            with phase('validate'):
+                purchase_order = build_order(data)
+        except ValidationError as e:
             return jsonify({
                 'code': 400,
-                'message': f'参数验证失败: {str(e)}',
+                'message': e.message,
                 'data': None
             }), 400
         
+        # 单价异常检测（基于写入前的历史统计）
+        price_alert = None
+        if request.args.get('price_check', '1' if app.config['PRICE_ANOMALY_CHECK'] else '0') == '1':
+            with phase('store'):
+                price_alert = check_order_price(purchase_order)
+        
         # 创建采购单
-        ORDER_COUNTER += 1
-        order_id = f"PO{ORDER_COUNTER}"
-        total_amount = quantity * unit_price
-        
-        purchase_order = {
-            'id': order_id,
-            'supplier_name': data['supplier_name'],
-            'product_name': data['product_name'],
-            'quantity': quantity,
-            'unit_price': unit_price,
-            'total_amount': round(total_amount, 2),
-            'category': data['category'],
-            'status': '待审批',
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'created_by': data.get('created_by', '系统'),
-            'remark': data.get('remark', '')
-        }
+        with phase('store'):
+            purchase_order = STORE.create(purchase_order)
         
-        PURCHASE_ORDERS.append(purchase_order)
+        if price_alert:
+            purchase_order = {**purchase_order, 'price_alert': price_alert}
         
         return jsonify({
             'code': 200,
@@ -110,24 +197,77 @@ def get_purchase_orders():
     Query Parameters:
     - category: 分类筛选 (可选)
     - status: 状态筛选 (可选)
+    - sort: 排序字段 total_amount / unit_price / quantity / created_at，前缀 - 表示降序 (可选)
+    - order: asc / desc，排序方向 (可选，默认 asc)
+    - limit: 最多返回条数 (可选)
+    - include_archived: 1 同时查询已归档的采购单 (可选)
     """
     try:
         category = request.args.get('category')
         status = request.args.get('status')
         
-        filtered_orders = PURCHASE_ORDERS
+        sort = request.args.get('sort') or None
+        descending = False
+        if sort and sort.startswith('-'):
+            sort, descending = sort[1:], True
+        if sort and sort not in SORT_FIELDS:
+            return jsonify({
+                'code': 400,
+                'message': f"sort 必须是 {', '.join(SORT_FIELDS)} 之一",
+                'data': None
+            }), 400
+        
+        direction = request.args.get('order')
+        if direction:
+            if direction not in ('asc', 'desc'):
+                return jsonify({
+                    'code': 400,
+                    'message': 'order 必须是 asc 或 desc',
+                    'data': None
+                }), 400
+            descending = direction == 'desc'
         
-        if category:
-            filtered_orders = [order for order in filtered_orders if order['category'] == category]
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+                if limit < 0:
+                    raise ValueError
+            except ValueError:
+                return jsonify({
+                    'code': 400,
+                    'message': 'limit 必须是非负整数',
+                    'data': None
+                }), 400
         
-        if status:
-            filtered_orders = [order for order in filtered_orders if order['status'] == status]
+        with phase('store'):
+            filtered_orders = STORE.list(
+                category=category, status=status, sort=sort, descending=descending, limit=limit
+            )
+            total = STORE.count(category=category, status=status) if limit is not None else len(filtered_orders)
+        
+        if request.args.get('include_archived') == '1':
+            # 归档过程中短暂同时存在于冷热两层的采购单以热存储为准
+            with phase('cold'):
+                hot_ids = {order['id'] for order in filtered_orders}
+                archived_orders = [
+                    {**order, 'archived': True}
+                    for order in COLD.list(category=category, status=status)
+                    if order['id'] not in hot_ids
+                ]
+                total += len(archived_orders)
+                # 冷存储没有有序索引，与热存储的前 limit 条合并后再排序截取
+                filtered_orders = archived_orders + list(filtered_orders)
+                if sort:
+                    filtered_orders.sort(key=lambda order: order[sort], reverse=descending)
+                if limit is not None:
+                    filtered_orders = filtered_orders[:limit]
         
         return jsonify({
             'code': 200,
             'message': '获取成功',
             'data': {
-                'total': len(filtered_orders),
+                'total': total,
                 'orders': filtered_orders
             }
         }), 200
@@ -142,9 +282,20 @@ def get_purchase_orders():
 
 @app.route('/api/purchase/<order_id>', methods=['GET'])
 def get_purchase_order(order_id):
-    """获取单个采购单详情"""
+    """
+    获取单个采购单详情
+    Query Parameters:
+    - include_archived: 1 热存储中不存在时查询已归档的采购单 (可选)
+    """
     try:
-        order = next((o for o in PURCHASE_ORDERS if o['id'] == order_id), None)
+        with phase('store'):
+            order = STORE.get(order_id)
+        
+        if not order and request.args.get('include_archived') == '1':
+            with phase('cold'):
+                order = COLD.get(order_id)
+            if order:
+                order = {**order, 'archived': True}
         
         if not order:
             return jsonify({
@@ -173,7 +324,18 @@ def update_purchase_order(order_id):
     try:
         data = request.get_json()
         
-        order = next((o for o in PURCHASE_ORDERS if o['id'] == order_id), None)
+        try:
+            with phase('validate'):
+                changes = validate_changes(data or {})
+        except ValidationError as e:
+            return jsonify({
+                'code': 400,
+                'message': e.message,
+                'data': None
+            }), 400
+        
+        with phase('store'):
+            order = STORE.update(order_id, changes)
         if not order:
             return jsonify({
                 'code': 404,
@@ -181,11 +343,6 @@ def update_purchase_order(order_id):
                 'data': None
             }), 404
         
-        if 'status' in data:
-            order['status'] = data['status']
-        if 'remark' in data:
-            order['remark'] = data['remark']
-        
         return jsonify({
             'code': 200,
             'message': '更新成功',
@@ -200,6 +357,325 @@ def update_purchase_order(order_id):
         }), 500
 
 
+@app.route('/api/purchase/import', methods=['POST'])
+def import_purchase_orders():
+    """
+    批量导入历史采购单
+    - multipart/form-data 上传 file 字段，或直接以 CSV / NDJSON 作为请求体
+    - format: csv / ndjson（可选，默认按文件名或 Content-Type 推断）
+    - batch_size: 每批写入条数（可选）
+    错误行与进度写入报告文件，可通过 /api/purchase/import/<import_id>/report 下载
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            stream = upload.stream
+            filename, content_type = upload.filename, upload.content_type
+        else:
+            stream = io.BufferedReader(request.stream)
+            filename, content_type = None, request.content_type
+        
+        try:
+            fmt = request.args.get('format') or detect_format(filename, content_type)
+            batch_size = int(request.args.get('batch_size', 5000))
+            if batch_size <= 0:
+                raise ValueError('batch_size 必须大于0')
+        except (ImportFormatError, ValueError) as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        
+        import_id = uuid.uuid4().hex[:12]
+        report_path = os.path.join(app.config['IMPORT_REPORT_DIR'], f'{import_id}.report.ndjson')
+        try:
+            with phase('store'):
+                summary = import_orders(stream, STORE, fmt, batch_size=batch_size, report_path=report_path)
+        except ImportFormatError as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        
+        summary['import_id'] = import_id
+        summary['report'] = f'/api/purchase/import/{import_id}/report'
+        return jsonify({
+            'code': 200,
+            'message': '导入完成',
+            'data': summary
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'服务器错误: {str(e)}',
+            'data': None
+        }), 500
+
+
+@app.route('/api/purchase/import/<import_id>/report', methods=['GET'])
+def get_import_report(import_id):
+    """下载批量导入报告（NDJSON）"""
+    report_path = os.path.join(app.config['IMPORT_REPORT_DIR'], f'{import_id}.report.ndjson')
+    if not re.fullmatch(r'[0-9a-f]{12}', import_id) or not os.path.exists(report_path):
+        return jsonify({
+            'code': 404,
+            'message': '导入报告不存在',
+            'data': None
+        }), 404
+    return send_file(report_path, mimetype='application/x-ndjson')
+
+
+@app.route('/api/purchase/price-index', methods=['GET'])
+def get_price_index():
+    """
+    获取产品单价统计
+    Query Parameters:
+    - product_name: 产品名称（必填）
+    - supplier_name: 供应商名称（可选，不填时返回产品整体统计及各供应商统计）
+    """
+    try:
+        product_name = request.args.get('product_name')
+        supplier_name = request.args.get('supplier_name')
+        
+        if not product_name:
+            return jsonify({
+                'code': 400,
+                'message': '缺少必需参数: product_name',
+                'data': None
+            }), 400
+        
+        with phase('store'):
+            if supplier_name:
+                stats = STORE.price_stats(product_name, supplier_name)
+                suppliers = None
+            else:
+                stats = STORE.price_stats(product_name)
+                suppliers = [
+                    {'supplier_name': name, **supplier_stats.to_dict()}
+                    for name, supplier_stats in STORE.supplier_price_stats(product_name).items()
+                ]
+        
+        if stats is None:
+            return jsonify({
+                'code': 404,
+                'message': '暂无该产品的单价记录',
+                'data': None
+            }), 404
+        
+        result = {
+            'product_name': product_name,
+            'supplier_name': supplier_name,
+            **stats.to_dict()
+        }
+        if suppliers is not None:
+            result['suppliers'] = suppliers
+        
+        return jsonify({
+            'code': 200,
+            'message': '获取成功',
+            'data': result
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'服务器错误: {str(e)}',
+            'data': None
+        }), 500
+
+
+@app.route('/api/purchase/archive', methods=['POST'])
+def archive_purchase_orders():
+    """
+    归档终态采购单到冷存储
+    Request Body (可选):
+    {
+        "max_age_days": 90,
+        "statuses": ["已完成", "已拒绝", "已取消"]   // 只能是这三种终态的子集
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            max_age_days = float(data.get('max_age_days', DEFAULT_MAX_AGE_DAYS))
+        except (ValueError, TypeError) as e:
+            return jsonify({
+                'code': 400,
+                'message': f'参数验证失败: {str(e)}',
+                'data': None
+            }), 400
+        
+        try:
+            with phase('store'):
+                result = archive_orders(STORE, COLD, max_age_days=max_age_days,
+                                        statuses=data.get('statuses') or FINAL_STATUSES)
+        except ArchiveError as e:
+            return jsonify({
+                'code': 400,
+                'message': f'参数验证失败: {str(e)}',
+                'data': None
+            }), 400
+        
+        return jsonify({
+            'code': 200,
+            'message': '归档完成',
+            'data': result
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'服务器错误: {str(e)}',
+            'data': None
+        }), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    提交后台报表任务
+    Request Body:
+    {
+        "kind": "spend_by_supplier" | "price_history" | "export",
+        "params": {"start": "2024-01-01", "end": "2024-01-31", "category": "水果", "product_name": "苹果"},
+        "include_archived": true,   // 可选，默认包含已归档的采购单
+        "refresh": false            // 可选，忽略缓存重新生成
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        include_archived = data.get('include_archived', True)
+        
+        with phase('store'):
+            source = (REPLICA or STORE).report_source()
+        
+        try:
+            job = JOBS.submit(
+                data.get('kind'),
+                data.get('params') or {},
+                source,
+                archive_dir=COLD.directory if include_archived else None,
+                refresh=bool(data.get('refresh'))
+            )
+        except JobError as e:
+            return jsonify({
+                'code': 400,
+                'message': str(e),
+                'data': None
+            }), 400
+        except JobLimitError as e:
+            return jsonify({
+                'code': 429,
+                'message': str(e),
+                'data': None
+            }), 429
+        
+        return jsonify({
+            'code': 200,
+            'message': '任务已提交',
+            'data': public_job(job)
+        }), 202
+    
+    except Exception as e:
+        return jsonify({
+            'code': 500,
+            'message': f'服务器错误: {str(e)}',
+            'data': None
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态: queued / running / cancelling / succeeded / failed / cancelled / expired"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({
+            'code': 404,
+            'message': '任务不存在',
+            'data': None
+        }), 404
+    
+    return jsonify({
+        'code': 200,
+        'message': '获取成功',
+        'data': public_job(job)
+    }), 200
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def download_job_result(job_id):
+    """下载任务结果"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({
+            'code': 404,
+            'message': '任务不存在',
+            'data': None
+        }), 404
+    
+    if job['status'] == 'expired':
+        return jsonify({
+            'code': 410,
+            'message': '任务结果已过期，请重新提交',
+            'data': public_job(job)
+        }), 410
+    
+    if job['status'] != 'succeeded':
+        return jsonify({
+            'code': 409,
+            'message': '任务尚未完成',
+            'data': public_job(job)
+        }), 409
+    
+    return send_file(
+        job['result_path'],
+        mimetype=RESULT_MIMETYPES[job['format']],
+        as_attachment=True,
+        download_name=f"{job['kind']}-{job_id}.{job['format']}"
+    )
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消任务"""
+    job = JOBS.cancel(job_id)
+    if job is None:
+        return jsonify({
+            'code': 404,
+            'message': '任务不存在',
+            'data': None
+        }), 404
+    
+    return jsonify({
+        'code': 200,
+        'message': '已取消' if job['status'] in ('cancelled', 'cancelling') else '任务已结束，无需取消',
+        'data': public_job(job)
+    }), 200
+
+
+@app.route('/api/replication/status', methods=['GET'])
+def get_replication_status():
+    """复制状态：副本返回已应用序号与延迟，主节点返回最新序号"""
+    if REPLICA is not None:
+        status = REPLICA.status()
+    else:
+        head = STORE.head_seq()
+        status = {
+            'role': 'primary' if head is not None else 'standalone',
+            'head_seq': head
+        }
+    
+    return jsonify({
+        'code': 200,
+        'message': '获取成功',
+        'data': status
+    }), 200
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -239,8 +715,15 @@ if __name__ == '__main__':
     print("  GET    /api/purchase/list    - 获取采购单列表")
     print("  GET    /api/purchase/<id>    - 获取采购单详情")
     print("  PUT    /api/purchase/<id>    - 更新采购单")
+    print("  POST   /api/purchase/import  - 批量导入历史采购单")
+    print("  GET    /api/purchase/price-index - 产品单价统计")
+    print("  POST   /api/purchase/archive - 归档终态采购单")
+    print("  POST   /api/jobs             - 提交后台报表任务")
+    print("  GET    /api/jobs/<id>        - 查询任务状态 (/result 下载结果)")
+    print("  GET    /api/replication/status - 复制状态")
     print("  GET    /api/health           - 健康检查")
     print("=" * 50)
     print("启动服务: http://127.0.0.1:5000")
+    print("生产部署请使用: python serve.py --workers 4")
     print("=" * 50)
     app.run(debug=True, host='127.0.0.1', port=5000)
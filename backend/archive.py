@@ -0,0 +1,288 @@
+"""
+采购单冷热分层
+
+进入终态且超过一定时间的采购单从热存储迁移到冷存储（只读段文件），
+热存储只保留活跃采购单，列表扫描与内存占用只与活跃采购单数量相关。
+
+段文件格式（不可变，只追加新段，不修改旧段）:
+    [记录区]  每条采购单单独 zlib 压缩的 JSON
+    [索引区]  按采购单号排序的定长条目: 采购单号(24 字节) + 偏移(8 字节) + 长度(4 字节)
+    [尾部]    索引区偏移(8 字节) + 条目数(8 字节) + 魔数(8 字节)
+
+读取时通过 mmap 映射段文件，按采购单号二分查找索引，只解压命中的记录。
+
+归档流程在冷存储目录的文件锁内串行执行（多个 worker、cron 与接口同时触发时不会重复归档）：
+1. 选出可归档的采购单，写成待发布段（.seg.pending，读者不可见）
+2. 从热存储删除仍未被修改的采购单（与更新接口在同一把写锁下比对）
+3. 待发布段只保留实际删除的采购单，改名为正式段
+进程在 2、3 之间退出时，下次归档先按热存储中是否还存在补发待发布段。
+
+命令行用法:
+    python archive.py --store sqlite:///data/purchase.db --archive-dir data/archive --max-age-days 90
+"""
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from store import create_store
+from validation import DATETIME_FORMAT
+
+# 终态：这些状态的采购单不会再变化，可以归档
+FINAL_STATUSES = ('已完成', '已拒绝', '已取消')
+DEFAULT_MAX_AGE_DAYS = 90
+
+SEGMENT_MAGIC = b'POSEG001'
+SEGMENT_SUFFIX = '.seg'
+PENDING_SUFFIX = '.pending'
+LOCK_NAME = '.archive.lock'
+ORDER_ID_WIDTH = 24
+INDEX_ENTRY = struct.Struct(f'<{ORDER_ID_WIDTH}sQI')
+TRAILER = struct.Struct('<QQ8s')
+
+
+class SegmentError(ValueError):
+    """段文件损坏或格式不正确"""
+
+
+class ArchiveError(ValueError):
+    """归档参数不正确"""
+
+
+def write_segment(path, orders, level=6):
+    """把采购单写成一个段文件；先写临时文件再原子改名，保证读者看不到写了一半的段"""
+    entries = []
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        offset = 0
+        for order in orders:
+            key = order['id'].encode('utf-8')
+            if len(key) > ORDER_ID_WIDTH:
+                raise SegmentError(f"采购单号过长: {order['id']}")
+            blob = zlib.compress(json.dumps(order, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), level)
+            f.write(blob)
+            entries.append((key, offset, len(blob)))
+            offset += len(blob)
+        entries.sort()
+        for key, record_offset, length in entries:
+            f.write(INDEX_ENTRY.pack(key, record_offset, length))
+        f.write(TRAILER.pack(offset, len(entries), SEGMENT_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+class Segment:
+    """只读段文件，通过 mmap 访问"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < TRAILER.size:
+            raise SegmentError(f'段文件损坏: {path}')
+        self.index_offset, self.count, magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != SEGMENT_MAGIC:
+            raise SegmentError(f'段文件格式不正确: {path}')
+
+    def close(self):
+        self.map.close()
+
+    def entry(self, i):
+        key, offset, length = INDEX_ENTRY.unpack_from(self.map, self.index_offset + i * INDEX_ENTRY.size)
+        return key.rstrip(b'\0'), offset, length
+
+    def read(self, offset, length):
+        return json.loads(zlib.decompress(self.map[offset:offset + length]))
+
+    def get(self, order_id):
+        """按采购单号二分查找，只解压命中的一条记录"""
+        key = order_id.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key, offset, length = self.entry(mid)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return self.read(offset, length)
+        return None
+
+    def __iter__(self):
+        """按写入顺序遍历全部采购单"""
+        entries = sorted((self.entry(i) for i in range(self.count)), key=lambda entry: entry[1])
+        for _, offset, length in entries:
+            yield self.read(offset, length)
+
+
+class ColdStore:
+    """冷存储：目录下的全部段文件；目录变化时（例如其他 worker 完成归档）自动加载新段"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.mtime:
+            return
+        with self.lock:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+            for name in names:
+                if name not in self.segments:
+                    self.segments[name] = Segment(os.path.join(self.directory, name))
+            self.mtime = mtime
+
+    def ordered_segments(self):
+        self.refresh()
+        return [self.segments[name] for name in sorted(self.segments)]
+
+    def get(self, order_id):
+        for segment in reversed(self.ordered_segments()):
+            order = segment.get(order_id)
+            if order is not None:
+                return order
+        return None
+
+    def list(self, category=None, status=None):
+        orders = []
+        for segment in self.ordered_segments():
+            for order in segment:
+                if category and order['category'] != category:
+                    continue
+                if status and order['status'] != status:
+                    continue
+                orders.append(order)
+        return orders
+
+    def count(self):
+        return sum(segment.count for segment in self.ordered_segments())
+
+    def new_segment_name(self):
+        return f"segment-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}{SEGMENT_SUFFIX}"
+
+    def append(self, orders):
+        """写入一个新段，返回段文件名"""
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.new_segment_name()
+        write_segment(os.path.join(self.directory, name), orders)
+        return name
+
+    @contextmanager
+    def exclusive(self):
+        """归档文件锁，跨进程串行化归档流程"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_NAME), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stage(self, orders):
+        """写入待发布段，返回路径"""
+        path = os.path.join(self.directory, self.new_segment_name() + PENDING_SUFFIX)
+        write_segment(path, orders)
+        return path
+
+    def publish(self, pending_path, keep):
+        """
+        发布待发布段，只保留 keep(采购单) 为真的记录
+        返回 (段文件名, 条数)，没有需要保留的记录时返回 (None, 0)
+        """
+        segment = Segment(pending_path)
+        try:
+            orders = list(segment)
+        finally:
+            segment.close()
+        kept = [order for order in orders if keep(order)]
+        name = os.path.basename(pending_path)[:-len(PENDING_SUFFIX)]
+        if len(kept) == len(orders):
+            os.replace(pending_path, os.path.join(self.directory, name))
+        else:
+            if kept:
+                write_segment(os.path.join(self.directory, name), kept)
+            os.remove(pending_path)
+        return (name if kept else None), len(kept)
+
+    def recover(self, store):
+        """补发上次归档中断留下的待发布段：热存储中已不存在的采购单即已删除"""
+        if not os.path.isdir(self.directory):
+            return 0
+        recovered = 0
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(SEGMENT_SUFFIX + PENDING_SUFFIX):
+                _, count = self.publish(os.path.join(self.directory, name),
+                                        lambda order: store.get(order['id']) is None)
+                recovered += count
+        return recovered
+
+
+def archive_orders(store, cold, max_age_days=DEFAULT_MAX_AGE_DAYS, statuses=FINAL_STATUSES, now=None):
+    """
+    把终态且创建时间早于 max_age_days 天前的采购单迁移到冷存储
+    先持久化待发布段，再从热存储删除，最后只发布实际删除的采购单
+    statuses 必须是 FINAL_STATUSES 的子集：冷存储不可修改，未结束的采购单归档后再也无法更新
+    """
+    if (not isinstance(statuses, (list, tuple)) or not statuses
+            or not all(isinstance(status, str) and status in FINAL_STATUSES for status in statuses)):
+        raise ArchiveError(f"statuses 必须是由 {'/'.join(FINAL_STATUSES)} 组成的非空列表")
+    try:
+        if max_age_days < 0:
+            raise ValueError
+        cutoff = ((now or datetime.now()) - timedelta(days=max_age_days)).strftime(DATETIME_FORMAT)
+    except (ValueError, TypeError, OverflowError):
+        raise ArchiveError(f'max_age_days 必须是合理范围内的非负天数: {max_age_days}')
+    with cold.exclusive():
+        cold.recover(store)
+        orders = store.archivable(statuses, cutoff)
+        if not orders:
+            return {'archived': 0, 'segment': None, 'cutoff': cutoff}
+        pending_path = cold.stage(orders)
+        removed = set(store.remove([order['id'] for order in orders],
+                                   expected={order['id']: order for order in orders}))
+        segment, archived = cold.publish(pending_path, lambda order: order['id'] in removed)
+    return {'archived': archived, 'segment': segment, 'cutoff': cutoff}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='归档终态采购单到冷存储')
+    parser.add_argument('--store', default=os.environ.get('PURCHASE_STORE'),
+                        help='热存储地址，如 sqlite:///data/purchase.db')
+    parser.add_argument('--archive-dir', default=os.environ.get('PURCHASE_ARCHIVE_DIR'),
+                        help='冷存储目录')
+    parser.add_argument('--max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help='只归档创建时间早于该天数的采购单')
+    parser.add_argument('--status', action='append', help='终态，可多次指定，默认为 ' + '/'.join(FINAL_STATUSES))
+    args = parser.parse_args(argv)
+
+    if not args.store or not args.store.startswith('sqlite:///'):
+        raise SystemExit('命令行归档需要共享存储，请通过 --store 或 PURCHASE_STORE 指定 sqlite:/// 地址')
+    if not args.archive_dir:
+        raise SystemExit('请通过 --archive-dir 或 PURCHASE_ARCHIVE_DIR 指定冷存储目录')
+
+    try:
+        result = archive_orders(create_store(args.store), ColdStore(args.archive_dir),
+                                max_age_days=args.max_age_days, statuses=tuple(args.status or FINAL_STATUSES))
+    except ArchiveError as e:
+        raise SystemExit(str(e))
+    print(f"归档 {result['archived']} 条采购单（创建时间早于 {result['cutoff']}），段文件: {result['segment']}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
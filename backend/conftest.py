@@ -0,0 +1,40 @@
+"""
+测试公共夹具
+"""
+import pytest
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+def build_order_record(i=None, **overrides):
+    """
+    构造一条完整的采购单记录
+    i: 给定时带上采购单号 PO{1000 + i}（直接写段文件、生成报表等不经过存储分配单号的场景）
+    未指定 total_amount 时按数量 × 单价计算
+    """
+    order = {
+        'supplier_name': '测试供应商',
+        'product_name': '苹果',
+        'quantity': 100,
+        'unit_price': 5.5,
+        'category': '水果',
+        'status': '待审批',
+        'created_at': '2024-01-01 10:00:00',
+        'created_by': '系统',
+        'remark': ''
+    }
+    order.update(overrides)
+    if 'total_amount' not in order:
+        order['total_amount'] = round(order['quantity'] * order['unit_price'], 2)
+    if i is not None:
+        order = {'id': f'PO{1000 + i}', **order}
+    return order
+
+
+@pytest.fixture
+def make_order():
+    """采购单记录工厂，见 build_order_record"""
+    return build_order_record
@@ -0,0 +1,173 @@
+"""
+历史采购单批量导入
+
+流式解析 CSV / NDJSON，按批写入存储：
+- 每行使用与创建接口相同的校验规则（validation.build_order），允许携带 status / created_at
+- 命令行（离线）导入期间删除二级索引，全部写入后统一重建；通过接口导入时服务仍在读写共享库，
+  索引保持不变，逐批维护
+- 单价统计随每批写入更新
+- 进度与错误行写入旁路报告文件（NDJSON，每行一个事件）
+
+命令行用法:
+    python importer.py orders.csv --store sqlite:///data/purchase.db --batch-size 5000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from store import create_store
+from validation import build_order, ValidationError
+
+SUPPORTED_FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 5000
+
+
+class ImportFormatError(ValueError):
+    """无法识别的导入文件格式"""
+
+
+def detect_format(filename=None, content_type=None):
+    """根据文件名或 Content-Type 推断导入格式"""
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    raise ImportFormatError('无法识别导入文件格式，请指定 format=csv 或 format=ndjson')
+
+
+def iter_records(stream, fmt):
+    """
+    逐行解析二进制流，产出 (行号, 记录, 解析错误)
+    不会一次性把整个文件读入内存
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ImportFormatError(f'不支持的导入格式: {fmt}')
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            # CSV 中的空单元格视为未填写
+            record = {
+                key.strip(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in record.items() if key
+            }
+            yield reader.line_num, record, None
+        return
+
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'JSON 解析失败: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, 'JSON 解析失败: 每行必须是一个对象'
+            continue
+        yield line_no, record, None
+
+
+class ImportReport:
+    """旁路报告文件，记录进度、错误行和最终汇总"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, event):
+        if self.file:
+            self.file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+def import_orders(stream, store, fmt, batch_size=DEFAULT_BATCH_SIZE, report_path=None, offline=False):
+    """
+    从二进制流导入采购单，返回导入汇总
+    offline: 离线导入，期间删除二级索引、结束时统一重建（不能用于正在服务的共享库）
+    """
+    report = ImportReport(report_path)
+    started = time.monotonic()
+    summary = {'processed': 0, 'imported': 0, 'failed': 0}
+    batch = []
+
+    def flush_batch():
+        summary['imported'] += store.bulk_insert(batch)
+        report.write({'type': 'progress', **summary, 'elapsed': round(time.monotonic() - started, 3)})
+        report.flush()
+        batch.clear()
+
+    try:
+        with store.bulk_load(drop_indexes=offline):
+            for line_no, record, error in iter_records(stream, fmt):
+                summary['processed'] += 1
+                if error is None:
+                    try:
+                        batch.append(build_order(record, allow_history=True))
+                    except ValidationError as e:
+                        error = e.message
+                if error is not None:
+                    summary['failed'] += 1
+                    report.write({'type': 'error', 'line': line_no, 'message': error, 'record': record})
+                if len(batch) >= batch_size:
+                    flush_batch()
+            if batch:
+                flush_batch()
+        summary['elapsed'] = round(time.monotonic() - started, 3)
+        report.write({'type': 'summary', **summary})
+    finally:
+        report.close()
+
+    summary['report'] = report_path
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量导入历史采购单')
+    parser.add_argument('path', help='CSV 或 NDJSON 文件路径')
+    parser.add_argument('--format', choices=SUPPORTED_FORMATS, help='文件格式，默认按扩展名推断')
+    parser.add_argument('--store', default=os.environ.get('PURCHASE_STORE'),
+                        help='目标存储地址，如 sqlite:///data/purchase.db')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每批写入条数')
+    parser.add_argument('--report', help='报告文件路径，默认为 <文件名>.report.ndjson')
+    parser.add_argument('--online', action='store_true',
+                        help='服务运行期间导入：保留二级索引，避免其他 worker 的查询退化为全表扫描')
+    args = parser.parse_args(argv)
+
+    if not args.store or not args.store.startswith('sqlite:///'):
+        raise SystemExit('命令行导入需要共享存储，请通过 --store 或 PURCHASE_STORE 指定 sqlite:/// 地址')
+
+    fmt = args.format or detect_format(args.path)
+    report_path = args.report or args.path + '.report.ndjson'
+    store = create_store(args.store)
+
+    with open(args.path, 'rb') as stream:
+        summary = import_orders(stream, store, fmt, batch_size=args.batch_size, report_path=report_path,
+                                offline=not args.online)
+
+    print(f"处理 {summary['processed']} 行，导入 {summary['imported']} 条，"
+          f"失败 {summary['failed']} 条，耗时 {summary['elapsed']} 秒")
+    print(f"报告文件: {report_path}")
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
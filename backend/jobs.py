@@ -0,0 +1,494 @@
+"""
+后台报表任务
+
+月末报表（供应商支出汇总、单价历史、全量导出）需要遍历全部采购单，放在请求线程中会超时。
+任务提交后在进程池中执行，CPU 密集的聚合不会占用请求线程的 GIL：
+- 提交 / 查询状态 / 下载结果 / 取消
+- 同时进行中的任务数有上限
+- 结果缓存在磁盘上，相同报表在有效期内直接复用
+
+任务状态保存为 JSON 文件，任务目录即任务队列：JobManager 只写入排队中的任务，
+由 JobRunner 认领后交给进程池执行（进程内存储在认领时才取快照，提交任务的请求不复制数据）。serve.py 为 JobRunner 单独启动一个长期运行的进程，
+worker 按请求数回收、SIGHUP 重载都不影响已提交的任务；单进程调试时 JobRunner 在后台线程中运行。
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from archive import ColdStore
+from store import ORDER_FIELDS
+
+ACTIVE_STATUSES = ('queued', 'running', 'cancelling')
+# 任务记录中只供服务端使用的字段（服务器路径、执行进程）
+PRIVATE_FIELDS = ('result_path', 'source', 'archive_dir', 'owner')
+# 工作进程每处理多少条采购单检查一次取消标记
+CANCEL_CHECK_INTERVAL = 20000
+
+
+class JobError(ValueError):
+    """任务参数不正确"""
+
+
+class JobLimitError(RuntimeError):
+    """进行中的任务数已达上限"""
+
+
+class JobCancelled(Exception):
+    """任务在执行过程中被取消"""
+
+
+# ==================== 报表 ====================
+
+def filter_orders(orders, params):
+    """按 start / end（创建日期，含当天）、category、status 筛选"""
+    start = params.get('start')
+    end = params.get('end')
+    category = params.get('category')
+    status = params.get('status')
+    for order in orders:
+        created_at = order['created_at']
+        if start and created_at[:len(start)] < start:
+            continue
+        if end and created_at[:len(end)] > end:
+            continue
+        if category and order['category'] != category:
+            continue
+        if status and order['status'] != status:
+            continue
+        yield order
+
+
+def spend_by_supplier(orders, params, out):
+    """供应商支出汇总，按金额从高到低"""
+    totals = {}
+    for order in filter_orders(orders, params):
+        item = totals.get(order['supplier_name'])
+        if item is None:
+            item = totals[order['supplier_name']] = [0, 0, 0.0]
+        item[0] += 1
+        item[1] += order['quantity']
+        item[2] += order['total_amount']
+    suppliers = [
+        {'supplier_name': name, 'orders': count, 'quantity': quantity, 'total_amount': round(amount, 2)}
+        for name, (count, quantity, amount) in totals.items()
+    ]
+    suppliers.sort(key=lambda item: item['total_amount'], reverse=True)
+    json.dump({
+        'params': params,
+        'total_amount': round(sum(item['total_amount'] for item in suppliers), 2),
+        'orders': sum(item['orders'] for item in suppliers),
+        'suppliers': suppliers
+    }, out, ensure_ascii=False)
+    return len(suppliers)
+
+
+def price_history(orders, params, out):
+    """按产品、按天的单价历史（可通过 product_name 只看一个产品）"""
+    product_name = params.get('product_name')
+    days = {}
+    for order in filter_orders(orders, params):
+        if product_name and order['product_name'] != product_name:
+            continue
+        key = (order['product_name'], order['created_at'][:10])
+        price = order['unit_price']
+        item = days.get(key)
+        if item is None:
+            days[key] = [1, price, price, price]
+        else:
+            item[0] += 1
+            item[1] += price
+            item[2] = min(item[2], price)
+            item[3] = max(item[3], price)
+    products = {}
+    for (product, date), (count, total, low, high) in sorted(days.items()):
+        products.setdefault(product, []).append({
+            'date': date, 'count': count, 'avg': round(total / count, 4), 'min': low, 'max': high
+        })
+    json.dump({'params': params, 'products': products}, out, ensure_ascii=False)
+    return len(days)
+
+
+def export_orders(orders, params, out):
+    """全量导出 CSV"""
+    writer = csv.writer(out)
+    writer.writerow(ORDER_FIELDS)
+    rows = 0
+    for order in filter_orders(orders, params):
+        writer.writerow([order[field] for field in ORDER_FIELDS])
+        rows += 1
+    return rows
+
+
+# 报表类型 -> (结果格式, 生成函数)
+REPORTS = {
+    'spend_by_supplier': ('json', spend_by_supplier),
+    'price_history': ('json', price_history),
+    'export': ('csv', export_orders),
+}
+
+RESULT_MIMETYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+}
+
+
+def iter_source(source, archive_dir, cancel_path):
+    """
+    在工作进程中遍历采购单
+    source: ('sqlite', 数据库路径) 直接读取共享存储；('orders', 采购单列表) 为进程内存储的快照
+    archive_dir: 不为空时同时遍历冷存储
+    """
+    kind, value = source
+    if kind == 'sqlite':
+        conn = sqlite3.connect(f'file:{value}?mode=ro', uri=True)
+        conn.row_factory = sqlite3.Row
+        orders = ({field: row[field] for field in ORDER_FIELDS}
+                  for row in conn.execute('SELECT * FROM purchase_orders ORDER BY seq'))
+    else:
+        orders = iter(value)
+
+    def with_cold():
+        if archive_dir:
+            for segment in ColdStore(archive_dir).ordered_segments():
+                yield from segment
+        yield from orders
+
+    for i, order in enumerate(with_cold(), start=1):
+        if i % CANCEL_CHECK_INTERVAL == 0 and os.path.exists(cancel_path):
+            raise JobCancelled()
+        yield order
+
+
+def run_report(meta_path, kind, params, source, archive_dir, result_path):
+    """工作进程入口：生成报表写入 result_path，返回结果行数"""
+    cancel_path = meta_path + '.cancel'
+    if os.path.exists(cancel_path):
+        raise JobCancelled()
+    update_meta(meta_path, status='running', started_at=time.time(), pid=os.getpid())
+
+    fmt, generate = REPORTS[kind]
+    tmp_path = f'{result_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+            rows = generate(iter_source(source, archive_dir, cancel_path), params, out)
+        os.replace(tmp_path, result_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+# ==================== 任务状态 ====================
+
+def write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def update_meta(path, **changes):
+    meta = read_json(path)
+    if meta is not None:
+        meta.update(changes)
+        write_json(path, meta)
+    return meta
+
+
+def public_job(job):
+    """返回给调用方的任务信息，不暴露服务器路径"""
+    return {key: value for key, value in job.items() if key not in PRIVATE_FIELDS}
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    """
+    任务执行器：扫描任务目录，认领排队中的任务交给进程池执行
+    认领时在任务记录中写入 owner（执行器进程号），同时在进程池中的任务不超过 max_workers，
+    其余任务留在磁盘队列中。停止时撤销尚未开始的任务（放回队列，由下一个执行器认领），等待运行中的任务结束。
+    进程内存储的任务只能由同一进程的执行器认领，snapshots 保存其取快照的函数。
+    """
+
+    def __init__(self, directory, max_workers=2):
+        self.jobs_dir = os.path.join(directory, 'jobs')
+        self.max_workers = max_workers
+        self.executor = None
+        self.futures = {}
+        self.snapshots = {}      # 任务编号 -> 返回采购单列表的函数
+        # 可重入：撤销 future 时 finish 回调在持有锁的线程中同步执行
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def meta_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def queued(self):
+        """排队中、尚未被认领的任务，按提交时间排序"""
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = read_json(os.path.join(self.jobs_dir, name))
+                if (job and job['status'] == 'queued' and job['owner'] is None
+                        and (job['source'][0] != 'memory' or job['id'] in self.snapshots)):
+                    jobs.append(job)
+        jobs.sort(key=lambda job: job['submitted_at'])
+        return jobs
+
+    def poll(self):
+        """认领排队中的任务并撤销已标记取消、尚未开始的任务，返回本次认领的任务数"""
+        with self.lock:
+            for job_id, future in list(self.futures.items()):
+                if os.path.exists(self.meta_path(job_id) + '.cancel'):
+                    future.cancel()
+            claimed = 0
+            for job in self.queued():
+                if len(self.futures) >= self.max_workers or self.stopping.is_set():
+                    break
+                meta_path = self.meta_path(job['id'])
+                if os.path.exists(meta_path + '.cancel'):
+                    update_meta(meta_path, status='cancelled', finished_at=time.time())
+                    continue
+                update_meta(meta_path, owner=os.getpid())
+                source = tuple(job['source'])
+                if source[0] == 'memory':
+                    source = ('orders', self.snapshots[job['id']]())
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                future = self.futures[job['id']] = self.executor.submit(
+                    run_report, meta_path, job['kind'], job['params'], source,
+                    job['archive_dir'], job['result_path']
+                )
+                future.add_done_callback(lambda f, job_id=job['id']: self.finish(job_id, f))
+                claimed += 1
+        return claimed
+
+    def finish(self, job_id, future):
+        with self.lock:
+            self.futures.pop(job_id, None)
+        meta_path = self.meta_path(job_id)
+        cancel_requested = os.path.exists(meta_path + '.cancel')
+        if future.cancelled() and not cancel_requested:
+            # 执行器停止时撤销的任务放回队列
+            update_meta(meta_path, owner=None)
+            return
+        self.snapshots.pop(job_id, None)
+        if future.cancelled() or cancel_requested:
+            update_meta(meta_path, status='cancelled', finished_at=time.time())
+            return
+        error = future.exception()
+        if isinstance(error, JobCancelled):
+            update_meta(meta_path, status='cancelled', finished_at=time.time())
+        elif error is not None:
+            update_meta(meta_path, status='failed', finished_at=time.time(), error=str(error))
+        else:
+            update_meta(meta_path, status='succeeded', finished_at=time.time(), rows=future.result())
+
+    def run(self, stopping, interval=0.2):
+        """主循环：stopping() 返回真之前持续认领任务，返回前等待运行中的任务结束"""
+        try:
+            while not stopping():
+                self.poll()
+                time.sleep(interval)
+        finally:
+            self.shutdown()
+
+    def start(self, interval=0.05):
+        """在后台线程中运行（单进程调试、测试时使用）"""
+        if self.thread is None:
+            self.stopping.clear()
+            self.thread = threading.Thread(
+                target=self.run, args=(self.stopping.is_set, interval), name='job-runner', daemon=True
+            )
+            self.thread.start()
+
+    def shutdown(self):
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+class JobManager:
+    """
+    报表任务管理：提交、查询、取消
+    run_jobs=False 时只写入任务队列，由独立的 JobRunner 进程执行（serve.py）
+    """
+
+    def __init__(self, directory, max_workers=2, max_active=4, ttl=3600, purge_interval=60, run_jobs=True):
+        self.directory = directory
+        self.jobs_dir = os.path.join(directory, 'jobs')
+        self.results_dir = os.path.join(directory, 'results')
+        self.max_active = max_active
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.last_purge = 0.0
+        self.runner = JobRunner(directory, max_workers) if run_jobs else None
+        self.lock = threading.Lock()
+
+    def shutdown(self):
+        if self.runner is not None:
+            self.runner.shutdown()
+
+    def meta_path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def active_count(self):
+        count = 0
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = self.get(name[:-len('.json')])
+                if job and job['status'] in ACTIVE_STATUSES:
+                    count += 1
+        return count
+
+    def submit(self, kind, params, source, archive_dir=None, refresh=False):
+        """
+        提交报表任务；有效期内的相同报表直接返回缓存结果
+        source: ('sqlite', 数据库路径) 或 ('memory', 取快照的函数)；后者由本进程的执行器在开始任务时调用
+        """
+        if kind not in REPORTS:
+            raise JobError(f"不支持的报表类型: {kind}，可选: {', '.join(REPORTS)}")
+        if not isinstance(params, dict):
+            raise JobError('params 必须是对象')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.purge_expired()
+
+        fmt = REPORTS[kind][0]
+        cache_key = hashlib.sha1(
+            json.dumps([kind, params, bool(archive_dir)], sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        result_path = os.path.join(self.results_dir, f'{cache_key}.{fmt}')
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex[:16],
+            'kind': kind,
+            'params': params,
+            'format': fmt,
+            'status': 'queued',
+            'submitted_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'owner': None,
+            'source': None,
+            'archive_dir': archive_dir,
+            'result_path': result_path,
+            'rows': None,
+            'error': None,
+            'cache_hit': False
+        }
+
+        if not refresh and os.path.exists(result_path) and now - os.path.getmtime(result_path) < self.ttl:
+            job.update(status='succeeded', finished_at=now, cache_hit=True)
+            write_json(self.meta_path(job['id']), job)
+            return job
+
+        with self.lock:
+            if self.active_count() >= self.max_active:
+                raise JobLimitError(f'进行中的任务已达上限 {self.max_active}，请稍后再试')
+            source_kind, value = source
+            if source_kind == 'memory':
+                if self.runner is None:
+                    raise JobError('进程内存储的报表只能在本进程执行，请使用共享存储')
+                # 记录提交进程：该进程退出后任务不会再被执行
+                self.runner.snapshots[job['id']] = value
+                source = ('memory', os.getpid())
+            job['source'] = list(source)
+            write_json(self.meta_path(job['id']), job)
+        if self.runner is not None:
+            self.runner.start()
+        return job
+
+    def get(self, job_id):
+        if not job_id.isalnum():
+            return None
+        job = read_json(self.meta_path(job_id))
+        if job is None:
+            return None
+        # 认领任务的执行器进程（进程内存储的任务为提交进程）异常退出，任务不会再完成；
+        # 正常停止的执行器会把未开始的任务放回队列
+        owner = job.get('owner')
+        if owner is None and job.get('source') and job['source'][0] == 'memory':
+            owner = job['source'][1]
+        if (job['status'] in ACTIVE_STATUSES and owner is not None and owner != os.getpid()
+                and not pid_alive(owner)):
+            job = update_meta(self.meta_path(job_id), status='failed', finished_at=time.time(),
+                              error='执行任务的进程已退出')
+        if job['status'] == 'succeeded' and not os.path.exists(job['result_path']):
+            job['status'] = 'expired'
+        return job
+
+    def cancel(self, job_id):
+        """取消任务：尚未被认领的任务直接撤销，其余任务由执行器在下次检查取消标记时停止"""
+        job = self.get(job_id)
+        if job is None or job['status'] not in ACTIVE_STATUSES:
+            return job
+        meta_path = self.meta_path(job_id)
+        with open(meta_path + '.cancel', 'w'):
+            pass
+        if job['owner'] is None:
+            if self.runner is not None:
+                self.runner.snapshots.pop(job_id, None)
+            return update_meta(meta_path, status='cancelled', finished_at=time.time())
+        return update_meta(meta_path, status='cancelling')
+
+    def wait(self, job_id, timeout=None, interval=0.01):
+        """轮询等待任务结束，超时返回当前状态"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] not in ACTIVE_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                return job
+            time.sleep(interval)
+
+    def purge_expired(self, force=False):
+        """删除过期的结果文件与任务记录（进行中任务的记录保留）"""
+        now = time.time()
+        if not force and now - self.last_purge < self.purge_interval:
+            return
+        self.last_purge = now
+        for directory in (self.results_dir, self.jobs_dir):
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if now - os.path.getmtime(path) >= self.ttl:
+                        if directory == self.jobs_dir:
+                            job = read_json(self.meta_path(name.split('.')[0]))
+                            if job and job['status'] in ACTIVE_STATUSES:
+                                continue
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
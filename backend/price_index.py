@@ -0,0 +1,137 @@
+"""
+单价滚动统计
+
+按 (产品, 供应商) 以及产品整体维护单价统计，每条新采购单 O(1) 更新，查询时无需扫描历史采购单：
+- 数量、均值、方差（Welford 算法）
+- 最小值、最大值、最近一次单价
+- 指数加权移动平均（EWMA），反映近期走势
+"""
+import math
+
+# EWMA 平滑系数，越大越偏向近期单价
+EWMA_ALPHA = 0.2
+# 异常检测：z 分数阈值与最少样本数
+ANOMALY_ZSCORE = 3.0
+ANOMALY_MIN_SAMPLES = 5
+
+# 产品整体统计使用的供应商键
+ALL_SUPPLIERS = ''
+
+
+class PriceStats:
+    """单个 (产品, 供应商) 的单价统计"""
+
+    FIELDS = ('count', 'mean', 'm2', 'min', 'max', 'ewma', 'last_price')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None, ewma=None, last_price=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+        self.ewma = ewma
+        self.last_price = last_price
+
+    def observe(self, price):
+        """加入一条单价"""
+        self.count += 1
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+        self.min = price if self.min is None else min(self.min, price)
+        self.max = price if self.max is None else max(self.max, price)
+        self.ewma = price if self.ewma is None else EWMA_ALPHA * price + (1 - EWMA_ALPHA) * self.ewma
+        self.last_price = price
+
+    @property
+    def variance(self):
+        """样本方差"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def zscore(self, price):
+        """单价偏离均值的标准差倍数；标准差为 0 时按均值的 1% 计算，避免零除"""
+        spread = max(self.stddev, abs(self.mean) * 0.01, 1e-9)
+        return (price - self.mean) / spread
+
+    def to_dict(self):
+        trend = (self.ewma - self.mean) / self.mean if self.count and self.mean else 0.0
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 4),
+            'variance': round(self.variance, 4),
+            'stddev': round(self.stddev, 4),
+            'min': self.min,
+            'max': self.max,
+            'ewma': round(self.ewma, 4) if self.ewma is not None else None,
+            'last_price': self.last_price,
+            'trend_pct': round(trend * 100, 2)
+        }
+
+
+def price_keys(order):
+    """一条采购单需要更新的统计键：(产品, 供应商) 与产品整体"""
+    return (
+        (order['product_name'], order['supplier_name']),
+        (order['product_name'], ALL_SUPPLIERS)
+    )
+
+
+def check_price(stats, price, threshold=ANOMALY_ZSCORE):
+    """
+    判断单价是否明显偏离历史分布
+    stats: 新采购单写入前的统计；样本不足时不做判断
+    返回提示信息，未偏离时返回 None
+    """
+    if stats is None or stats.count < ANOMALY_MIN_SAMPLES:
+        return None
+    zscore = stats.zscore(price)
+    if abs(zscore) < threshold:
+        return None
+    return {
+        'unit_price': price,
+        'zscore': round(zscore, 2),
+        'mean': round(stats.mean, 4),
+        'stddev': round(stats.stddev, 4),
+        'samples': stats.count,
+        'message': f'单价偏离历史均值 {abs(zscore):.1f} 个标准差'
+    }
+
+
+class PriceIndex:
+    """进程内单价统计索引"""
+
+    def __init__(self):
+        self.stats = {}          # (产品, 供应商) -> PriceStats
+        self.suppliers = {}      # 产品 -> 供应商集合
+
+    def clear(self):
+        self.stats.clear()
+        self.suppliers.clear()
+
+    def observe(self, order):
+        for key in price_keys(order):
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = PriceStats()
+            stats.observe(order['unit_price'])
+        self.suppliers.setdefault(order['product_name'], set()).add(order['supplier_name'])
+
+    def load(self, product_name, supplier_name, stats):
+        """直接写入已有统计（副本从主节点复制数据时使用）"""
+        self.stats[(product_name, supplier_name)] = stats
+        if supplier_name != ALL_SUPPLIERS:
+            self.suppliers.setdefault(product_name, set()).add(supplier_name)
+
+    def get(self, product_name, supplier_name=ALL_SUPPLIERS):
+        return self.stats.get((product_name, supplier_name))
+
+    def supplier_stats(self, product_name):
+        """某产品下各供应商的统计"""
+        return {
+            supplier: self.stats[(product_name, supplier)]
+            for supplier in sorted(self.suppliers.get(product_name, ()))
+        }
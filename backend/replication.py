@@ -0,0 +1,172 @@
+"""
+只读副本
+
+主节点使用开启 changelog 的 SqliteStore，每次写入在同一事务内向 changes 表追加有序变更。
+副本（Follower）以只读方式打开主节点的数据库文件：
+1. 在一个读事务内复制全部采购单与单价统计，并记下此刻的变更序号
+2. 后台线程持续拉取该序号之后的变更，应用到本进程带索引的 MemoryStore
+
+副本拒绝写请求，报告复制延迟，并支持等待到指定序号（read-your-writes）。
+主节点只保留最近的变更（store.CHANGELOG_RETENTION 条），落后超过该范围的副本重新复制快照。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from price_index import PriceStats
+from store import MemoryStore
+
+
+class ReplicationError(RuntimeError):
+    """无法连接主节点或主节点未开启变更流"""
+
+
+class Follower:
+    """追踪主节点变更流的只读副本"""
+
+    def __init__(self, source_path, store=None, poll_interval=0.05, batch_size=1000):
+        self.source_path = source_path
+        self.store = store if store is not None else MemoryStore()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.applied_seq = 0
+        self.applied_ts = None
+        self.head_seq = 0
+        self.last_poll = None
+        self.last_error = None
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            uri = f'file:{self.source_path}?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def bootstrap(self):
+        """在同一个读事务（WAL 快照）内复制全部数据并记录对应的变更序号"""
+        conn = self.connect()
+        conn.execute('BEGIN')
+        try:
+            try:
+                head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+            except sqlite3.OperationalError as e:
+                raise ReplicationError(f'主节点未开启变更流: {e}')
+            orders = [dict(row) for row in conn.execute('SELECT * FROM purchase_orders ORDER BY seq')]
+            prices = [dict(row) for row in conn.execute('SELECT * FROM price_stats')]
+        finally:
+            conn.execute('COMMIT')
+
+        store = self.store
+        with store.lock:
+            store.clear()
+            with store.bulk_load():
+                for order in orders:
+                    order.pop('seq', None)
+                    store.put(order)
+            for row in prices:
+                stats = PriceStats(**{field: row[field] for field in PriceStats.FIELDS})
+                store.prices.load(row['product_name'], row['supplier_name'], stats)
+
+        with self.condition:
+            self.applied_seq = self.head_seq = head
+            self.applied_ts = time.time()
+            self.condition.notify_all()
+
+    def apply(self, rows):
+        """按顺序应用变更；连续的删除（例如一次归档）合并为一次 remove"""
+        store = self.store
+        deletes = []
+        with store.lock:
+            for row in rows:
+                op = row['op']
+                if op == 'delete':
+                    deletes.append(row['order_id'])
+                    continue
+                if deletes:
+                    store.remove(deletes)
+                    deletes = []
+                order = store.put(json.loads(row['payload']))
+                if op == 'create':
+                    store.record_prices([order])
+            if deletes:
+                store.remove(deletes)
+
+    def poll(self):
+        """拉取并应用一批变更，返回本次应用条数"""
+        conn = self.connect()
+        rows = conn.execute(
+            'SELECT seq, ts, op, order_id, payload FROM changes WHERE seq > ? ORDER BY seq LIMIT ?',
+            (self.applied_seq, self.batch_size)
+        ).fetchall()
+        head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+        if rows and rows[0]['seq'] > self.applied_seq + 1:
+            # 需要的变更已被主节点清理，重新复制快照
+            self.bootstrap()
+            return 0
+        if rows:
+            self.apply(rows)
+        with self.condition:
+            if rows:
+                self.applied_seq = rows[-1]['seq']
+                self.applied_ts = rows[-1]['ts']
+            self.head_seq = max(head, self.applied_seq)
+            self.last_poll = time.time()
+            self.condition.notify_all()
+        return len(rows)
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                applied = self.poll()
+                self.last_error = None
+            except sqlite3.Error as e:
+                self.last_error = str(e)
+                applied = 0
+            if applied < self.batch_size:
+                self.stopping.wait(self.poll_interval)
+
+    def start(self):
+        self.bootstrap()
+        self.thread = threading.Thread(target=self.run, name='replication-follower', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def wait_for(self, seq, timeout):
+        """等待副本应用到 seq，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.applied_seq < seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def report_source(self):
+        """后台报表任务直接只读打开主节点数据库文件，不复制副本的内存数据"""
+        return ('sqlite', self.source_path)
+
+    def status(self):
+        with self.condition:
+            behind = self.head_seq - self.applied_seq
+            return {
+                'role': 'follower',
+                'source': self.source_path,
+                'applied_seq': self.applied_seq,
+                'head_seq': self.head_seq,
+                'lag_changes': behind,
+                # 落后时为最后应用的变更距今的时间，已追平时为 0
+                'lag_seconds': round(time.time() - self.applied_ts, 3) if behind and self.applied_ts else 0.0,
+                'last_poll': self.last_poll,
+                'last_error': self.last_error
+            }
@@ -0,0 +1,312 @@
+"""
+水果蔬菜采购管理系统 - 生产启动器
+
+主进程创建监听 socket 后 prefork 多个 worker 进程，worker 共享该 socket 并各自处理请求：
+- 关闭 debug 与自动重载
+- worker 处理 max_requests（加随机抖动）个请求后自动退出并由主进程补齐
+- SIGHUP: 平滑重载。先启动新一代 worker（重新导入 app，加载最新代码；副本还要复制完快照），
+  新 worker 全部通过管道报告就绪后，再让旧 worker 处理完当前请求后退出，重载期间始终有 worker 在 accept
+- 后台报表任务由单独的执行器进程运行，worker 只写入磁盘上的任务队列，回收、重载 worker 不影响任务；
+  重载时旧执行器不再认领新任务，等运行中的任务结束后退出
+- SIGTERM / SIGINT: 平滑停止
+- 所有 worker 通过 PURCHASE_STORE 指向的 SQLite 文件共享采购单数据
+- --publish-changes: 作为主节点发布变更流；--replica-of: 作为只读副本追踪主节点
+
+用法:
+    python serve.py --host 0.0.0.0 --port 5000 --workers 4 --max-requests 10000
+"""
+import argparse
+import importlib
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE = 'sqlite:///' + os.path.join(BASE_DIR, 'data', 'purchase.db')
+DEFAULT_ACCESS_LOG = os.path.join(BASE_DIR, 'data', 'access.log')
+DEFAULT_JOB_DIR = os.path.join(BASE_DIR, 'data', 'jobs')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='采购管理系统生产启动器')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='监听端口')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker 进程数')
+    parser.add_argument('--max-requests', type=int, default=10000,
+                        help='单个 worker 处理多少请求后回收，0 表示不回收')
+    parser.add_argument('--max-requests-jitter', type=int, default=1000,
+                        help='回收阈值的随机抖动，避免所有 worker 同时重启')
+    parser.add_argument('--backlog', type=int, default=2048, help='监听队列长度')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='平滑停止时等待 worker 退出的秒数')
+    parser.add_argument('--store', default=os.environ.get('PURCHASE_STORE', DEFAULT_STORE),
+                        help='共享存储地址，如 sqlite:///data/purchase.db')
+    parser.add_argument('--publish-changes', action='store_true',
+                        default=os.environ.get('PURCHASE_CHANGELOG') == '1',
+                        help='主节点：每次写入追加有序变更记录，供只读副本追踪')
+    parser.add_argument('--replica-of', default=os.environ.get('PURCHASE_REPLICA_OF', ''),
+                        help='只读副本：主节点存储地址，如 sqlite:///data/purchase.db')
+    parser.add_argument('--access-log', default=os.environ.get('PURCHASE_ACCESS_LOG', DEFAULT_ACCESS_LOG),
+                        help='JSON 行访问日志路径（含各阶段耗时），传空字符串关闭')
+    return parser.parse_args(argv)
+
+
+def create_listener(host, port, backlog):
+    """创建所有 worker 共享的监听 socket"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    # 非阻塞：多个 worker 同时被唤醒时，没抢到连接的 worker 不会阻塞在 accept 上
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, host, port, max_requests, ready_fd=None):
+    """
+    worker 进程主循环，返回后进程退出
+    ready_fd: 导入 app、创建服务之后写入一个字节通知主进程已可以处理请求
+    """
+    from werkzeug.serving import BaseWSGIServer
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # 在 fork 之后导入 app，保证 SIGHUP 重载时加载最新代码，且每个 worker 拥有独立的存储连接
+    app_module = importlib.import_module('app')
+    flask_app = app_module.app
+    flask_app.debug = False
+
+    served = [0]
+
+    def counting_app(environ, start_response):
+        served[0] += 1
+        return flask_app(environ, start_response)
+
+    from timing import flush_access_logs
+
+    server = BaseWSGIServer(host, port, counting_app, fd=sock.fileno())
+    server.timeout = 1.0
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+    try:
+        while not stopping and (not max_requests or served[0] < max_requests):
+            server.handle_request()
+            # 访问日志按批写出；空闲时（handle_request 每秒超时返回）写出积压的记录
+            flush_access_logs(stale_only=True)
+    finally:
+        # worker 通过 os._exit 退出，不会执行 atexit
+        flush_access_logs()
+        server.socket.close()
+
+
+def run_job_runner():
+    """任务执行器进程主循环：收到 SIGTERM 后撤销未开始的任务（放回队列），等待运行中的任务结束再返回"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    from jobs import JobRunner
+
+    runner = JobRunner(
+        os.environ['PURCHASE_JOB_DIR'],
+        max_workers=int(os.environ.get('PURCHASE_JOB_WORKERS', 2))
+    )
+    runner.run(lambda: bool(stopping))
+
+
+class Arbiter:
+    """主进程：维护 worker 数量，处理重载与停止信号"""
+
+    def __init__(self, args):
+        self.args = args
+        self.sock = None
+        self.workers = {}        # pid -> 代数
+        self.job_runners = {}    # 任务执行器 pid -> 代数
+        self.starting = {}       # 尚未报告就绪的 worker pid -> 就绪管道读端
+        self.ready = set()       # 已就绪的 worker pid
+        self.retiring = []       # 等新一代 worker 就绪后再停止的旧代数
+        self.generation = 0
+        self.signals = []
+
+    def worker_max_requests(self):
+        if not self.args.max_requests:
+            return 0
+        return self.args.max_requests + random.randint(0, max(self.args.max_requests_jitter, 0))
+
+    def spawn(self, processes, target, *args):
+        """fork 子进程执行 target，记入 processes（pid -> 代数）"""
+        pid = os.fork()
+        if pid:
+            processes[pid] = self.generation
+            return pid
+        # 子进程
+        exit_code = 0
+        try:
+            random.seed()
+            target(*args)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
+    def spawn_worker(self):
+        ready_r, ready_w = os.pipe()
+        pid = self.spawn(self.workers, run_worker, self.sock, self.args.host, self.args.port,
+                         self.worker_max_requests(), ready_w)
+        # 关闭主进程的写端：worker 未就绪就退出时读端读到 EOF
+        os.close(ready_w)
+        self.starting[pid] = ready_r
+        return pid
+
+    def spawn_missing(self):
+        current = sum(1 for generation in self.workers.values() if generation == self.generation)
+        for _ in range(self.args.workers - current):
+            self.spawn_worker()
+        if self.generation not in self.job_runners.values():
+            self.spawn(self.job_runners, run_job_runner)
+
+    def signal_processes(self, processes, sig, generation=None):
+        for pid, process_generation in list(processes.items()):
+            if generation is None or process_generation == generation:
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    processes.pop(pid, None)
+
+    def kill_workers(self, sig, generation=None):
+        """向 worker 与任务执行器发送信号"""
+        for processes in (self.workers, self.job_runners):
+            self.signal_processes(processes, sig, generation)
+
+    def wait_ready(self, timeout):
+        """等待 worker 的就绪通知，最多 timeout 秒"""
+        if not self.starting:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(self.starting.values()), [], [], timeout)
+        for pid, fd in list(self.starting.items()):
+            if fd in readable:
+                # 读到 EOF 表示 worker 未就绪就退出了，由 reap_workers 清理后补齐
+                if os.read(fd, 1):
+                    self.ready.add(pid)
+                os.close(fd)
+                del self.starting[pid]
+
+    def retire_old_generations(self):
+        """新一代 worker 全部就绪后再让旧 worker 退出；新代码启动失败时旧 worker 继续服务"""
+        if not self.retiring:
+            return
+        current = [pid for pid, generation in self.workers.items() if generation == self.generation]
+        if len(current) < self.args.workers or not self.ready.issuperset(current):
+            return
+        for generation in self.retiring:
+            self.signal_processes(self.workers, signal.SIGTERM, generation)
+        self.retiring.clear()
+        print(f"[serve] 第 {self.generation} 代 worker 已就绪，旧 worker 处理完当前请求后退出")
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.workers.pop(pid, None)
+            self.job_runners.pop(pid, None)
+            self.ready.discard(pid)
+            fd = self.starting.pop(pid, None)
+            if fd is not None:
+                os.close(fd)
+
+    def reload(self):
+        """
+        平滑重载：新一代 worker 就绪后（retire_old_generations）再停止旧 worker，监听 socket 始终保持打开
+        任务执行器不处理请求，旧执行器立即停止认领新任务
+        """
+        old_generation = self.generation
+        self.generation += 1
+        print(f"[serve] 收到 SIGHUP，启动第 {self.generation} 代 worker")
+        self.spawn_missing()
+        self.retiring.append(old_generation)
+        self.signal_processes(self.job_runners, signal.SIGTERM, old_generation)
+
+    def stop(self):
+        print("[serve] 正在停止 worker...")
+        self.kill_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while (self.workers or self.job_runners) and time.monotonic() < deadline:
+            self.reap_workers()
+            time.sleep(0.1)
+        self.kill_workers(signal.SIGKILL)
+        self.reap_workers()
+
+    def run(self):
+        os.environ['PURCHASE_STORE'] = self.args.store
+        os.environ['PURCHASE_CHANGELOG'] = '1' if self.args.publish_changes else ''
+        os.environ['PURCHASE_REPLICA_OF'] = self.args.replica_of
+        os.environ['PURCHASE_ACCESS_LOG'] = self.args.access_log
+        os.environ['PURCHASE_JOB_DIR'] = os.environ.get('PURCHASE_JOB_DIR') or DEFAULT_JOB_DIR
+        os.environ['PURCHASE_JOB_RUNNER'] = 'external'
+        if BASE_DIR not in sys.path:
+            sys.path.insert(0, BASE_DIR)
+
+        self.sock = create_listener(self.args.host, self.args.port, self.args.backlog)
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        print("=" * 50)
+        print("水果蔬菜采购管理系统 - 生产模式")
+        print("=" * 50)
+        print(f"监听地址: http://{self.args.host}:{self.args.port}")
+        print(f"worker 数: {self.args.workers}  回收阈值: {self.args.max_requests}")
+        if self.args.replica_of:
+            print(f"只读副本: 追踪 {self.args.replica_of}")
+        else:
+            print(f"共享存储: {self.args.store}{'（发布变更流）' if self.args.publish_changes else ''}")
+        print(f"访问日志: {self.args.access_log or '关闭'}")
+        print(f"主进程 PID: {os.getpid()} (kill -HUP 平滑重载)")
+        print("=" * 50)
+
+        self.spawn_missing()
+        try:
+            while True:
+                while self.signals:
+                    signum = self.signals.pop(0)
+                    if signum in (signal.SIGTERM, signal.SIGINT):
+                        return
+                    if signum == signal.SIGHUP:
+                        self.reload()
+                self.reap_workers()
+                self.spawn_missing()
+                self.retire_old_generations()
+                self.wait_ready(0.5)
+        finally:
+            self.stop()
+            self.sock.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers < 1:
+        raise SystemExit('--workers 必须大于 0')
+    Arbiter(args).run()
+
+
+if __name__ == '__main__':
+    main()
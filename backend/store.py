@@ -0,0 +1,760 @@
+"""
+采购单存储层
+
+- MemoryStore: 进程内存储（开发模式 / 单元测试默认使用）
+- SqliteStore: 基于 SQLite 文件的共享存储，多个 worker 进程共用同一份数据
+
+通过环境变量 PURCHASE_STORE 选择：
+- 未设置 或 memory://        -> MemoryStore
+- sqlite:///path/to/file.db -> SqliteStore
+
+SqliteStore 开启 changelog（环境变量 PURCHASE_CHANGELOG=1）后，每次写入在同一事务内
+追加一条有序变更记录到 changes 表，供只读副本（replication.py）追踪。
+
+两种存储都为 SORT_FIELDS 维护有序索引，按字段排序取前 k 条（可叠加分类 / 状态筛选）无需全量排序。
+"""
+import bisect
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from price_index import PriceIndex, PriceStats, price_keys, ALL_SUPPLIERS
+
+ORDER_ID_PREFIX = 'PO'
+ORDER_ID_START = 1000
+
+# 采购单字段（SQLite 表列顺序与此一致）
+ORDER_FIELDS = (
+    'id', 'supplier_name', 'product_name', 'quantity', 'unit_price',
+    'total_amount', 'category', 'status', 'created_at', 'created_by', 'remark'
+)
+
+# 允许通过更新接口修改的字段
+UPDATABLE_FIELDS = ('status', 'remark')
+
+# 列表接口支持排序的字段
+SORT_FIELDS = ('total_amount', 'unit_price', 'quantity', 'created_at')
+
+# 变更流：seq 严格递增，op 为 create / update / delete，payload 为变更后的完整采购单
+# 只保留最近 CHANGELOG_RETENTION 条，每追加 CHANGELOG_PRUNE_INTERVAL 条清理一次（副本从快照启动，不需要完整历史）
+CHANGELOG_RETENTION = 100000
+CHANGELOG_PRUNE_INTERVAL = 1000
+CHANGES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    op TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    payload TEXT
+);
+"""
+
+
+def format_order_id(seq):
+    """根据自增序号生成采购单号"""
+    return f"{ORDER_ID_PREFIX}{ORDER_ID_START + seq}"
+
+
+class SortIndex:
+    """
+    MemoryStore 的有序索引
+    按 (分类, 状态) 分桶，每个桶内为每个排序字段维护一个有序列表，元素为 (字段值, 插入序号, 采购单号)；
+    插入 / 删除通过二分定位。查询时对匹配筛选条件的桶做多路归并，取前 k 条为 O(k log 桶数)。
+    字段值相同时按插入顺序排列（降序时新的在前）。
+    """
+
+    def __init__(self):
+        self.buckets = {}        # (分类, 状态) -> {字段: 有序列表}
+        self.seqs = {}           # 采购单号 -> 插入序号
+        self.next_seq = 0
+
+    def clear(self):
+        self.buckets.clear()
+        self.seqs.clear()
+        self.next_seq = 0
+
+    def rebuild(self, orders):
+        """按列表顺序重新分配插入序号并重建全部有序列表"""
+        self.clear()
+        for order in orders:
+            seq = self.seqs[order['id']] = self.next_seq
+            self.next_seq += 1
+            bucket = self.bucket(order)
+            for field in SORT_FIELDS:
+                bucket[field].append((order[field], seq, order['id']))
+        for bucket in self.buckets.values():
+            for keys in bucket.values():
+                keys.sort()
+
+    @staticmethod
+    def key(order):
+        """分桶键；分类或状态不可哈希时抛出 TypeError（修改存储之前调用，失败时不会只写入一半）"""
+        key = (order['category'], order['status'])
+        hash(key)
+        return key
+
+    def bucket(self, order):
+        key = self.key(order)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {field: [] for field in SORT_FIELDS}
+        return bucket
+
+    def add(self, order):
+        seq = self.seqs.get(order['id'])
+        if seq is None:
+            seq = self.seqs[order['id']] = self.next_seq
+            self.next_seq += 1
+        bucket = self.bucket(order)
+        for field in SORT_FIELDS:
+            bisect.insort(bucket[field], (order[field], seq, order['id']))
+
+    def add_many(self, orders):
+        """
+        批量加入尚未建立索引的采购单（已有插入序号的跳过）：新索引项按桶收集、排序后追加到各有序列表再排序，
+        Timsort 识别出两段有序序列后线性合并，整体为一次 O(n) 合并，而不是每条 insort 一次 O(n) 移动
+        """
+        added = {}
+        for order in orders:
+            if order['id'] in self.seqs:
+                continue
+            seq = self.seqs[order['id']] = self.next_seq
+            self.next_seq += 1
+            added.setdefault(self.key(order), []).append((order, seq))
+        for key, entries in added.items():
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = {field: [] for field in SORT_FIELDS}
+            for field in SORT_FIELDS:
+                keys = bucket[field]
+                keys.extend(sorted((order[field], seq, order['id']) for order, seq in entries))
+                keys.sort()
+
+    def discard(self, order):
+        """移除采购单当前字段值对应的索引项（修改采购单之前调用），保留插入序号"""
+        bucket = self.buckets.get((order['category'], order['status']))
+        seq = self.seqs.get(order['id'])
+        if bucket is None or seq is None:
+            return
+        for field in SORT_FIELDS:
+            keys = bucket[field]
+            key = (order[field], seq, order['id'])
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def remove(self, order):
+        """删除采购单的全部索引项"""
+        self.discard(order)
+        self.seqs.pop(order['id'], None)
+
+    def matching(self, field, category=None, status=None):
+        return [
+            bucket[field] for (bucket_category, bucket_status), bucket in self.buckets.items()
+            if (not category or bucket_category == category) and (not status or bucket_status == status)
+        ]
+
+    def count(self, category=None, status=None):
+        return sum(len(keys) for keys in self.matching(SORT_FIELDS[0], category, status))
+
+    def query(self, field, descending=False, category=None, status=None, limit=None):
+        """按字段排序的采购单号，最多 limit 条"""
+        lists = self.matching(field, category, status)
+        if descending:
+            merged = heapq.merge(*(reversed(keys) for keys in lists), reverse=True)
+        else:
+            merged = heapq.merge(*lists)
+        return [key[2] for key in itertools.islice(merged, limit)]
+
+
+class MemoryStore:
+    """
+    进程内存储，orders 列表保持插入顺序，by_id 为主键索引，sort_index 为有序索引
+    删除只更新索引并记下数量，orders 列表在下次需要完整列表时一次性清理（副本连续应用大量删除时不必每条重建）
+    """
+
+    def __init__(self, orders=None):
+        self.orders = orders if orders is not None else []
+        self.by_id = {}
+        self.counter = ORDER_ID_START
+        self.lock = threading.RLock()
+        self.bulk_loading = False
+        self.removed = 0         # orders 列表中尚未清理的已删除采购单数
+        self.unindexed = None    # 在线批量导入期间尚未加入有序索引的采购单
+        self.online_loads = 0
+        self.prices = PriceIndex()
+        self.sort_index = SortIndex()
+        self.rebuild_indexes()
+
+    def rebuild_indexes(self):
+        """根据 orders 列表重建索引"""
+        with self.lock:
+            self.compact()
+            self.by_id = {order['id']: order for order in self.orders}
+            self.sort_index.rebuild(self.orders)
+
+    def compact(self):
+        """从 orders 列表清理已删除的采购单（调用方持有锁）"""
+        if self.removed:
+            self.orders[:] = [order for order in self.orders if self.by_id.get(order['id']) is order]
+            self.removed = 0
+
+    def clear(self):
+        with self.lock:
+            self.removed = 0
+            self.orders.clear()
+            self.by_id.clear()
+            self.sort_index.clear()
+            self.prices.clear()
+
+    def create(self, order):
+        """分配采购单号并保存，返回保存后的采购单"""
+        with self.lock:
+            order = {'id': f"{ORDER_ID_PREFIX}{self.counter + 1}", **order}
+            # 先算出分桶键并更新单价统计：字段不合法时在写入任何数据之前失败
+            self.sort_index.key(order)
+            self.prices.observe(order)
+            self.counter += 1
+            self.orders.append(order)
+            self.by_id[order['id']] = order
+            self.sort_index.add(order)
+            return order
+
+    @contextmanager
+    def bulk_load(self, drop_indexes=True):
+        """
+        批量导入期间不逐行维护索引，结束时统一重建一次
+        drop_indexes=False（服务运行期间导入）：主键索引照常逐行维护，按单号查询、修改、删除始终可用；
+        有序索引在导入结束时整体合并一次，导入期间排序查询与分类 / 状态计数只反映导入前的数据
+        """
+        if not drop_indexes:
+            with self.lock:
+                self.online_loads += 1
+                if self.unindexed is None:
+                    self.unindexed = []
+            try:
+                yield self
+            finally:
+                with self.lock:
+                    self.online_loads -= 1
+                    # 导入期间已删除的跳过；已修改的在 update 时已加入索引，由 add_many 跳过
+                    pending = [order for order in self.unindexed if self.by_id.get(order['id']) is order]
+                    self.unindexed = [] if self.online_loads else None
+                    self.sort_index.add_many(pending)
+            return
+        with self.lock:
+            # 导入期间 by_id 不再维护，先清理已删除的采购单，之后的 compact 不依赖 by_id
+            self.compact()
+            self.bulk_loading = True
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.bulk_loading = False
+                self.rebuild_indexes()
+
+    def bulk_insert(self, orders):
+        """批量保存已校验的采购单，返回保存条数"""
+        with self.lock:
+            # 统计键或分桶键不可哈希时整批在写入任何数据之前失败
+            for order in orders:
+                hash(price_keys(order))
+                self.sort_index.key(order)
+            saved = []
+            for order in orders:
+                self.prices.observe(order)
+                self.counter += 1
+                saved.append({'id': f"{ORDER_ID_PREFIX}{self.counter}", **order})
+            self.orders.extend(saved)
+            if not self.bulk_loading:
+                for order in saved:
+                    self.by_id[order['id']] = order
+                if self.unindexed is not None:
+                    self.unindexed.extend(saved)
+                else:
+                    for order in saved:
+                        self.sort_index.add(order)
+            return len(saved)
+
+    def get(self, order_id):
+        return self.by_id.get(order_id)
+
+    def update(self, order_id, changes):
+        """更新采购单字段，采购单不存在时返回 None"""
+        with self.lock:
+            order = self.by_id.get(order_id)
+            if order is None:
+                return None
+            changes = {field: changes[field] for field in UPDATABLE_FIELDS if field in changes}
+            # 新的分桶键不合法时在移出索引之前失败
+            self.sort_index.key({**order, **changes})
+            self.sort_index.discard(order)
+            order.update(changes)
+            self.sort_index.add(order)
+            return order
+
+    def list(self, category=None, status=None, sort=None, descending=False, limit=None):
+        """
+        筛选采购单，默认按插入顺序
+        sort: SORT_FIELDS 之一，通过有序索引取前 limit 条
+        """
+        if sort and sort not in SORT_FIELDS:
+            raise ValueError(f'不支持的排序字段: {sort}')
+        if sort:
+            with self.lock:
+                order_ids = self.sort_index.query(sort, descending, category, status, limit)
+                return [self.by_id[order_id] for order_id in order_ids]
+        with self.lock:
+            self.compact()
+        orders = self.orders
+        if category:
+            orders = [order for order in orders if order['category'] == category]
+        if status:
+            orders = [order for order in orders if order['status'] == status]
+        return orders[:limit] if limit is not None else orders
+
+    def count(self, category=None, status=None):
+        if category or status:
+            return self.sort_index.count(category, status)
+        return len(self.orders) - self.removed
+
+    def head_seq(self):
+        """进程内存储不发布变更流"""
+        return None
+
+    def report_source(self):
+        """后台报表任务的数据来源：由执行器在开始任务时调用 snapshot 取快照，不占用提交任务的请求"""
+        return ('memory', self.snapshot)
+
+    def snapshot(self):
+        """当前采购单的快照"""
+        with self.lock:
+            self.compact()
+            return list(self.orders)
+
+    def put(self, order):
+        """按采购单号写入或覆盖（只读副本应用变更时使用）"""
+        with self.lock:
+            existing = self.by_id.get(order['id'])
+            self.sort_index.key(order if existing is None else {**existing, **order})
+            if existing is not None:
+                self.sort_index.discard(existing)
+                existing.update(order)
+                self.sort_index.add(existing)
+                return existing
+            order = dict(order)
+            self.orders.append(order)
+            if not self.bulk_loading:
+                self.by_id[order['id']] = order
+                self.sort_index.add(order)
+            return order
+
+    def archivable(self, statuses, before):
+        """终态且创建时间不晚于 before 的采购单"""
+        with self.lock:
+            self.compact()
+            return [
+                order for order in self.orders
+                if order['status'] in statuses and order['created_at'] <= before
+            ]
+
+    def remove(self, order_ids, expected=None):
+        """
+        从热存储删除采购单，返回实际删除的采购单号
+        expected: 采购单号 -> 选出时的采购单；可修改字段已经变化（例如归档期间被修改了状态）的不删除
+        每条只做主键与有序索引的删除，orders 列表延迟清理
+        """
+        with self.lock:
+            if self.bulk_loading:
+                # 批量导入期间 by_id 不完整，直接按列表删除
+                wanted = set(order_ids)
+                removed = {
+                    order['id'] for order in self.orders
+                    if order['id'] in wanted and (expected is None or all(
+                        order[field] == expected[order['id']][field] for field in UPDATABLE_FIELDS
+                    ))
+                }
+                self.orders[:] = [order for order in self.orders if order['id'] not in removed]
+                return [order_id for order_id in order_ids if order_id in removed]
+            removed = []
+            for order_id in order_ids:
+                order = self.by_id.get(order_id)
+                if order is None:
+                    continue
+                if expected is not None and any(
+                    order[field] != expected[order_id][field] for field in UPDATABLE_FIELDS
+                ):
+                    continue
+                del self.by_id[order_id]
+                self.sort_index.remove(order)
+                removed.append(order_id)
+            self.removed += len(removed)
+            return removed
+
+    def record_prices(self, orders):
+        """把采购单单价计入滚动统计（create / bulk_insert 已自动计入）"""
+        with self.lock:
+            for order in orders:
+                self.prices.observe(order)
+
+    def price_stats(self, product_name, supplier_name=ALL_SUPPLIERS):
+        return self.prices.get(product_name, supplier_name)
+
+    def supplier_price_stats(self, product_name):
+        return self.prices.supplier_stats(product_name)
+
+
+class SqliteStore:
+    """
+    SQLite 共享存储
+    每个线程（以及 fork 出的每个 worker 进程）使用独立连接，WAL 模式下读写互不阻塞
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS purchase_orders (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT UNIQUE,
+        supplier_name TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit_price REAL NOT NULL,
+        total_amount REAL NOT NULL,
+        category TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        created_by TEXT,
+        remark TEXT
+    );
+    CREATE TABLE IF NOT EXISTS price_stats (
+        product_name TEXT NOT NULL,
+        supplier_name TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        mean REAL NOT NULL,
+        m2 REAL NOT NULL,
+        min REAL,
+        max REAL,
+        ewma REAL,
+        last_price REAL,
+        PRIMARY KEY (product_name, supplier_name)
+    );
+    """
+
+    # 二级索引，批量导入时先删除，导入完成后统一重建
+    # 每个排序字段一组：单字段索引用于不筛选的排序，(分类, 字段) / (状态, 字段) 用于筛选后排序，
+    # 索引隐含 seq（rowid），ORDER BY 字段, seq 可以直接按索引顺序读取前 k 行
+    INDEXES = {
+        **{f'idx_orders_{field}': f'purchase_orders ({field})' for field in SORT_FIELDS},
+        **{f'idx_orders_category_{field}': f'purchase_orders (category, {field})' for field in SORT_FIELDS},
+        **{f'idx_orders_status_{field}': f'purchase_orders (status, {field})' for field in SORT_FIELDS},
+    }
+
+    def __init__(self, path, timeout=30.0, changelog=False):
+        self.path = path
+        self.timeout = timeout
+        self.changelog = changelog
+        self.published = 0
+        self.local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection().executescript(self.SCHEMA)
+        if changelog:
+            self.connection().executescript(CHANGES_SCHEMA)
+        self.create_indexes()
+
+    def connection(self):
+        """获取当前线程的连接；fork 后的子进程会重新建立连接"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def row_to_order(row):
+        return {field: row[field] for field in ORDER_FIELDS}
+
+    def publish(self, conn, changes):
+        """在调用方的事务内追加变更记录，changes 为 (op, 采购单号, 采购单) 序列"""
+        if not self.changelog:
+            return
+        now = time.time()
+        cursor = conn.executemany(
+            'INSERT INTO changes (ts, op, order_id, payload) VALUES (?, ?, ?, ?)',
+            (
+                (now, op, order_id, json.dumps(order, ensure_ascii=False) if order is not None else None)
+                for op, order_id, order in changes
+            )
+        )
+        self.published += cursor.rowcount
+        if self.published >= CHANGELOG_PRUNE_INTERVAL:
+            self.published = 0
+            self.prune_changes(conn)
+
+    def prune_changes(self, conn, retention=CHANGELOG_RETENTION):
+        """删除最近 retention 条之前的变更（按 seq 范围删除，走主键），至少保留最新一条"""
+        conn.execute(
+            'DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?',
+            (max(retention, 1),)
+        )
+
+    def report_source(self):
+        """后台报表任务的数据来源：工作进程直接只读打开数据库文件"""
+        return ('sqlite', self.path)
+
+    def head_seq(self):
+        """变更流最新序号，未开启 changelog 时为 None"""
+        if not self.changelog:
+            return None
+        return self.connection().execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+    def create_indexes(self):
+        conn = self.connection()
+        for name, target in self.INDEXES.items():
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+    def drop_indexes(self):
+        conn = self.connection()
+        for name in self.INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def clear(self):
+        conn = self.connection()
+        conn.execute('DELETE FROM purchase_orders')
+        conn.execute('DELETE FROM price_stats')
+
+    @contextmanager
+    def bulk_load(self, drop_indexes=True):
+        """
+        批量导入期间删除二级索引，结束时统一重建一次
+        索引删除对所有连接可见，只能用于离线导入；服务运行期间导入传 drop_indexes=False
+        """
+        if not drop_indexes:
+            yield self
+            return
+        self.drop_indexes()
+        try:
+            yield self
+        finally:
+            self.create_indexes()
+
+    def bulk_insert(self, orders):
+        """一个事务内批量保存已校验的采购单（列表）并更新单价统计，返回保存条数"""
+        columns = [field for field in ORDER_FIELDS if field != 'id']
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.executemany(
+                f"INSERT INTO purchase_orders ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                ([order[field] for field in columns] for order in orders)
+            )
+            count = cursor.rowcount
+            conn.execute(
+                'UPDATE purchase_orders SET id = ? || (seq + ?) WHERE id IS NULL',
+                (ORDER_ID_PREFIX, ORDER_ID_START)
+            )
+            if self.changelog and count:
+                # 写事务独占数据库，同一批插入的 seq 连续
+                last_seq = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                first_seq = last_seq - count + 1
+                saved = ({'id': format_order_id(first_seq + i), **order} for i, order in enumerate(orders))
+                self.publish(conn, (('create', order['id'], order) for order in saved))
+            self.observe_prices(conn, orders)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return count
+
+    def create(self, order):
+        conn = self.connection()
+        columns = [field for field in ORDER_FIELDS if field != 'id']
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                f"INSERT INTO purchase_orders ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                [order[field] for field in columns]
+            )
+            order_id = format_order_id(cursor.lastrowid)
+            conn.execute('UPDATE purchase_orders SET id = ? WHERE seq = ?', (order_id, cursor.lastrowid))
+            order = {'id': order_id, **order}
+            self.publish(conn, [('create', order_id, order)])
+            self.observe_prices(conn, [order])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return order
+
+    def get(self, order_id):
+        row = self.connection().execute(
+            'SELECT * FROM purchase_orders WHERE id = ?', (order_id,)
+        ).fetchone()
+        return self.row_to_order(row) if row else None
+
+    def update(self, order_id, changes):
+        fields = [field for field in UPDATABLE_FIELDS if field in changes]
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if fields:
+                conn.execute(
+                    f"UPDATE purchase_orders SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?",
+                    [changes[field] for field in fields] + [order_id]
+                )
+            row = conn.execute('SELECT * FROM purchase_orders WHERE id = ?', (order_id,)).fetchone()
+            order = self.row_to_order(row) if row else None
+            if order is not None and fields:
+                self.publish(conn, [('update', order_id, order)])
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return order
+
+    @staticmethod
+    def where(category=None, status=None):
+        conditions, params = [], []
+        if category:
+            conditions.append('category = ?')
+            params.append(category)
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def list(self, category=None, status=None, sort=None, descending=False, limit=None):
+        """
+        筛选采购单，默认按插入顺序
+        sort: SORT_FIELDS 之一，由对应索引按序读取前 limit 行
+        """
+        if sort and sort not in SORT_FIELDS:
+            raise ValueError(f'不支持的排序字段: {sort}')
+        where, params = self.where(category, status)
+        sql = 'SELECT * FROM purchase_orders' + where
+        direction = 'DESC' if descending else 'ASC'
+        if sort:
+            sql += f' ORDER BY {sort} {direction}, seq {direction}'
+        else:
+            sql += ' ORDER BY seq'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [self.row_to_order(row) for row in self.connection().execute(sql, params)]
+
+    def count(self, category=None, status=None):
+        where, params = self.where(category, status)
+        return self.connection().execute('SELECT COUNT(*) FROM purchase_orders' + where, params).fetchone()[0]
+
+    def archivable(self, statuses, before):
+        rows = self.connection().execute(
+            f"SELECT * FROM purchase_orders WHERE status IN ({', '.join('?' for _ in statuses)}) "
+            f"AND created_at <= ? ORDER BY seq",
+            [*statuses, before]
+        )
+        return [self.row_to_order(row) for row in rows]
+
+    def remove(self, order_ids, expected=None, chunk_size=500):
+        """
+        从热存储删除采购单，返回实际删除的采购单号
+        expected: 采购单号 -> 选出时的采购单；与更新在同一把写锁下逐条比对可修改字段，已变化的不删除
+        """
+        order_ids = list(order_ids)
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if expected is None:
+                for start in range(0, len(order_ids), chunk_size):
+                    chunk = order_ids[start:start + chunk_size]
+                    conn.execute(
+                        f"DELETE FROM purchase_orders WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+                    )
+            else:
+                sql = (f"DELETE FROM purchase_orders WHERE id = ? AND "
+                       f"{' AND '.join(f'{field} IS ?' for field in UPDATABLE_FIELDS)}")
+                order_ids = [
+                    order_id for order_id in order_ids
+                    if conn.execute(
+                        sql, [order_id, *(expected[order_id][field] for field in UPDATABLE_FIELDS)]
+                    ).rowcount
+                ]
+            self.publish(conn, (('delete', order_id, None) for order_id in order_ids))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return order_ids
+
+    def load_price_stats(self, product_name, supplier_name):
+        row = self.connection().execute(
+            'SELECT * FROM price_stats WHERE product_name = ? AND supplier_name = ?',
+            (product_name, supplier_name)
+        ).fetchone()
+        return PriceStats(**{field: row[field] for field in PriceStats.FIELDS}) if row else None
+
+    def observe_prices(self, conn, orders):
+        """在调用方的写事务内读改写单价统计，多个 worker 并发更新不会丢失"""
+        touched = {}
+        for order in orders:
+            for key in price_keys(order):
+                stats = touched.get(key)
+                if stats is None:
+                    stats = touched[key] = self.load_price_stats(*key) or PriceStats()
+                stats.observe(order['unit_price'])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO price_stats (product_name, supplier_name, {', '.join(PriceStats.FIELDS)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in PriceStats.FIELDS)})",
+            ([*key, *(getattr(stats, field) for field in PriceStats.FIELDS)] for key, stats in touched.items())
+        )
+
+    def record_prices(self, orders):
+        """把采购单单价计入滚动统计"""
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.observe_prices(conn, orders)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def price_stats(self, product_name, supplier_name=ALL_SUPPLIERS):
+        return self.load_price_stats(product_name, supplier_name)
+
+    def supplier_price_stats(self, product_name):
+        rows = self.connection().execute(
+            'SELECT * FROM price_stats WHERE product_name = ? AND supplier_name != ? ORDER BY supplier_name',
+            (product_name, ALL_SUPPLIERS)
+        )
+        return {
+            row['supplier_name']: PriceStats(**{field: row[field] for field in PriceStats.FIELDS})
+            for row in rows
+        }
+
+
+def create_store(url=None, orders=None, changelog=None):
+    """
+    根据存储地址创建存储实例
+    orders: MemoryStore 使用的采购单列表（便于与 PURCHASE_ORDERS 共享同一对象）
+    changelog: 是否发布变更流，默认读取环境变量 PURCHASE_CHANGELOG
+    """
+    url = url if url is not None else os.environ.get('PURCHASE_STORE', '')
+    if changelog is None:
+        changelog = os.environ.get('PURCHASE_CHANGELOG') == '1'
+    if not url or url == 'memory://':
+        if changelog:
+            raise ValueError('发布变更流需要 SQLite 共享存储')
+        return MemoryStore(orders)
+    if url.startswith('sqlite:///'):
+        return SqliteStore(url[len('sqlite:///'):], changelog=changelog)
+    raise ValueError(f'不支持的存储地址: {url}')
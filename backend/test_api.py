@@ -3,6 +3,7 @@
 使用 pytest 框架
 """
 import pytest
+import io
 import json
 import sys
 import os
@@ -10,7 +11,13 @@ import os
 # 添加后端路径
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app import app, PURCHASE_ORDERS
+import app as app_module
+from app import app, STORE
+from archive import ColdStore
+from jobs import JobManager
+from replication import Follower
+from store import SqliteStore
+from timing import AccessLog, flush_access_logs, format_server_timing
 
 
 @pytest.fixture
@@ -20,7 +27,7 @@ def client():
     with app.test_client() as client:
         yield client
     # 清空测试数据
-    PURCHASE_ORDERS.clear()
+    STORE.clear()
 
 
 @pytest.fixture
@@ -49,6 +56,65 @@ class TestHealthCheck:
         assert 'timestamp' in data
 
 
+class TestServerTiming:
+    """请求耗时分析测试"""
+    
+    def test_timing_headers(self, client, sample_order_data):
+        """测试响应附带 Server-Timing 与 X-Request-ID"""
+        response = client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        
+        phases = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+        assert phases[-1] == 'total'
+        assert {'parse', 'validate', 'store', 'serialize'} <= set(phases)
+        assert response.headers['X-Request-ID']
+    
+    def test_request_id_passthrough(self, client):
+        """测试沿用调用方传入的请求编号，非法编号重新生成"""
+        response = client.get('/api/health', headers={'X-Request-ID': 'lb-42'})
+        assert response.headers['X-Request-ID'] == 'lb-42'
+        
+        response = client.get('/api/health', headers={'X-Request-ID': 'bad id'})
+        assert response.headers['X-Request-ID'] != 'bad id'
+    
+    def test_access_log(self, client, tmp_path, monkeypatch):
+        """测试访问日志以 JSON 行记录各阶段耗时"""
+        log_path = tmp_path / 'access.log'
+        monkeypatch.setitem(app.config, 'ACCESS_LOG', str(log_path))
+        
+        response = client.get('/api/purchase/list')
+        flush_access_logs()
+        
+        record = json.loads(log_path.read_text(encoding='utf-8').splitlines()[-1])
+        assert record['request_id'] == response.headers['X-Request-ID']
+        assert record['path'] == '/api/purchase/list'
+        assert record['status'] == 200
+        assert 'store' in record['phases_us']
+        assert record['total_us'] >= record['phases_us']['store']
+    
+    def test_access_log_flushes_when_stale(self, tmp_path):
+        """测试写入时距上次写出超过刷新间隔即写出，不依赖 serve.py 的空闲检查"""
+        log_path = tmp_path / 'access.log'
+        log = AccessLog(str(log_path), batch_size=100, flush_interval=3600)
+        log.write((log.last_flush, 'r1', 'GET', '/a', '200 OK', 1500, {}))
+        assert not log_path.exists()
+        
+        log.flush_interval_ns = 0
+        log.write((log.last_flush, 'r2', 'GET', '/b', '200 OK', 2500, {'store': 1000}))
+        records = [json.loads(line) for line in log_path.read_text(encoding='utf-8').splitlines()]
+        assert [record['request_id'] for record in records] == ['r1', 'r2']
+        assert records[1]['total_us'] == 2 and records[1]['phases_us'] == {'store': 1}
+        log.close()
+    
+    def test_server_timing_format(self):
+        """测试 Server-Timing 以毫秒输出，精确到微秒"""
+        assert format_server_timing({'store': 8123456, 'parse': 999}, 1234567890) == \
+            'store;dur=8.123, parse;dur=0.000, total;dur=1234.567'
+
+
 class TestCreatePurchaseOrder:
     """创建采购单测试"""
     
@@ -119,6 +185,37 @@ class TestCreatePurchaseOrder:
         data = json.loads(response.data)
         assert data['code'] == 400
     
+    def test_create_purchase_order_non_finite_values(self, client, sample_order_data):
+        """测试 nan / inf 单价与数量被拒绝，不影响单价统计"""
+        invalid = [('unit_price', 'nan'), ('unit_price', 'inf'), ('unit_price', '-inf'),
+                   ('unit_price', 1e308), ('quantity', 'nan'), ('quantity', 1e400)]
+        for field, value in invalid:
+            body = dict(sample_order_data, **{field: value})
+            response = client.post(
+                '/api/purchase/create',
+                data=json.dumps(body),
+                content_type='application/json'
+            )
+            assert response.status_code == 400, (field, value)
+        
+        response = client.get('/api/purchase/price-index?product_name=苹果')
+        assert response.status_code == 404
+    
+    def test_create_purchase_order_non_string_fields(self, client, sample_order_data):
+        """测试供应商、产品、分类必须是字符串"""
+        sample_order_data['category'] = ['水果']
+        sample_order_data['supplier_name'] = {'x': 1}
+        
+        response = client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        
+        assert response.status_code == 400
+        assert 'supplier_name, category' in json.loads(response.data)['message']
+        assert json.loads(client.get('/api/purchase/list').data)['data']['total'] == 0
+    
     def test_create_purchase_order_empty_body(self, client):
         """测试空请求体"""
         response = client.post(
@@ -191,6 +288,34 @@ class TestGetPurchaseOrders:
         assert data['data']['orders'][0]['category'] == '蔬菜'
 
 
+class TestSortOrders:
+    """列表排序测试"""
+    
+    def test_sort_and_limit(self, client, sample_order_data):
+        """测试按金额降序取前 k 条"""
+        for quantity in (10, 30, 20):
+            client.post(
+                '/api/purchase/create',
+                data=json.dumps({**sample_order_data, 'quantity': quantity}),
+                content_type='application/json'
+            )
+        
+        response = client.get('/api/purchase/list?sort=-total_amount&limit=2')
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        assert data['total'] == 3
+        assert [order['quantity'] for order in data['orders']] == [30, 20]
+        
+        data = json.loads(client.get('/api/purchase/list?sort=quantity&order=asc&category=水果').data)['data']
+        assert [order['quantity'] for order in data['orders']] == [10, 20, 30]
+    
+    def test_invalid_sort_params(self, client):
+        """测试不支持的排序参数"""
+        assert client.get('/api/purchase/list?sort=remark').status_code == 400
+        assert client.get('/api/purchase/list?sort=quantity&order=up').status_code == 400
+        assert client.get('/api/purchase/list?limit=-1').status_code == 400
+
+
 class TestGetSingleOrder:
     """获取单个采购单详情测试"""
     
@@ -248,6 +373,330 @@ class TestUpdateOrder:
         data = json.loads(response.data)
         assert data['code'] == 200
         assert data['data']['status'] == '已批准'
+    
+    def test_update_order_non_string_status(self, client, sample_order_data):
+        """测试状态不是字符串时拒绝更新，采购单保持不变"""
+        create_response = client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        order_id = json.loads(create_response.data)['data']['id']
+        
+        for body in ({'status': ['x']}, {'remark': 1}, ['x']):
+            response = client.put(
+                f'/api/purchase/{order_id}',
+                data=json.dumps(body),
+                content_type='application/json'
+            )
+            assert response.status_code == 400
+        
+        order = json.loads(client.get(f'/api/purchase/{order_id}').data)['data']
+        assert order['status'] == '待审批'
+        response = client.get('/api/purchase/list?status=待审批&sort=total_amount')
+        assert [item['id'] for item in json.loads(response.data)['data']['orders']] == [order_id]
+
+
+class TestPriceIndex:
+    """单价统计接口测试"""
+    
+    def create_orders(self, client, sample_order_data, prices, query=''):
+        responses = []
+        for price in prices:
+            sample_order_data['unit_price'] = price
+            responses.append(client.post(
+                '/api/purchase/create' + query,
+                data=json.dumps(sample_order_data),
+                content_type='application/json'
+            ))
+        return responses
+    
+    def test_price_index(self, client, sample_order_data):
+        """测试创建采购单后单价统计即时更新"""
+        self.create_orders(client, sample_order_data, [5.0, 6.0, 7.0])
+        
+        response = client.get('/api/purchase/price-index?product_name=苹果')
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        assert data['count'] == 3
+        assert data['mean'] == 6.0
+        assert data['min'] == 5.0
+        assert data['max'] == 7.0
+        assert data['suppliers'][0]['supplier_name'] == '测试供应商'
+    
+    def test_price_index_not_found(self, client):
+        """测试查询无记录的产品"""
+        assert client.get('/api/purchase/price-index?product_name=榴莲').status_code == 404
+        assert client.get('/api/purchase/price-index').status_code == 400
+    
+    def test_price_check_flags_outlier(self, client, sample_order_data):
+        """测试开启单价检测后标记偏离的单价"""
+        self.create_orders(client, sample_order_data, [5.0, 5.2, 4.9, 5.1, 5.0])
+        
+        normal, outlier = self.create_orders(client, sample_order_data, [5.1, 55.0], '?price_check=1')
+        
+        assert 'price_alert' not in json.loads(normal.data)['data']
+        alert = json.loads(outlier.data)['data']['price_alert']
+        assert alert['zscore'] > 3
+        assert alert['samples'] == 6
+
+
+class TestArchive:
+    """冷热分层测试"""
+    
+    @pytest.fixture(autouse=True)
+    def cold_store(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(app_module, 'COLD', ColdStore(str(tmp_path)))
+    
+    def create_completed_order(self, client, sample_order_data):
+        response = client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        order_id = json.loads(response.data)['data']['id']
+        client.put(
+            f'/api/purchase/{order_id}',
+            data=json.dumps({'status': '已完成'}),
+            content_type='application/json'
+        )
+        return order_id
+    
+    def test_archived_order_only_visible_on_request(self, client, sample_order_data):
+        """测试归档后的采购单只在 include_archived=1 时返回"""
+        archived_id = self.create_completed_order(client, sample_order_data)
+        client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        
+        response = client.post(
+            '/api/purchase/archive',
+            data=json.dumps({'max_age_days': 0}),
+            content_type='application/json'
+        )
+        assert json.loads(response.data)['data']['archived'] == 1
+        
+        hot = json.loads(client.get('/api/purchase/list').data)['data']
+        assert hot['total'] == 1
+        assert client.get(f'/api/purchase/{archived_id}').status_code == 404
+        
+        all_orders = json.loads(client.get('/api/purchase/list?include_archived=1').data)['data']
+        assert all_orders['total'] == 2
+        assert all_orders['orders'][0]['archived'] is True
+        
+        response = client.get(f'/api/purchase/{archived_id}?include_archived=1')
+        assert response.status_code == 200
+        assert json.loads(response.data)['data']['status'] == '已完成'
+    
+    def test_archive_keeps_recent_orders(self, client, sample_order_data):
+        """测试未超过期限的采购单不会被归档"""
+        self.create_completed_order(client, sample_order_data)
+        
+        response = client.post('/api/purchase/archive')
+        
+        assert response.status_code == 200
+        assert json.loads(response.data)['data']['archived'] == 0
+    
+    def test_archive_rejects_invalid_params(self, client, sample_order_data):
+        """测试只能归档终态，天数超出范围返回 400"""
+        order_id = self.create_completed_order(client, sample_order_data)
+        pending = json.loads(client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        ).data)['data']['id']
+        
+        for body in ({'max_age_days': 0, 'statuses': ['待审批']},
+                     {'max_age_days': 0, 'statuses': '已完成'},
+                     {'max_age_days': 0, 'statuses': [['已完成']]},
+                     {'max_age_days': 1e9},
+                     {'max_age_days': 'nan'},
+                     {'max_age_days': -1}):
+            response = client.post(
+                '/api/purchase/archive',
+                data=json.dumps(body),
+                content_type='application/json'
+            )
+            assert response.status_code == 400, body
+        
+        assert client.get(f'/api/purchase/{pending}').status_code == 200
+        assert client.get(f'/api/purchase/{order_id}').status_code == 200
+
+
+class TestReplica:
+    """只读副本接口测试"""
+    
+    @pytest.fixture
+    def replica(self, tmp_path, monkeypatch):
+        primary = SqliteStore(str(tmp_path / 'primary.db'), changelog=True)
+        primary.create({
+            'supplier_name': '测试供应商', 'product_name': '苹果', 'quantity': 1,
+            'unit_price': 5.5, 'total_amount': 5.5, 'category': '水果', 'status': '待审批',
+            'created_at': '2024-01-01 10:00:00', 'created_by': '系统', 'remark': ''
+        })
+        follower = Follower(primary.path, store=STORE)
+        follower.bootstrap()
+        monkeypatch.setattr(app_module, 'REPLICA', follower)
+        monkeypatch.setitem(app.config, 'REPLICA_WAIT_TIMEOUT', 0.05)
+        return follower
+    
+    def test_replica_serves_reads_and_rejects_writes(self, client, replica, sample_order_data):
+        """测试副本提供读服务并拒绝写请求"""
+        response = client.get('/api/purchase/PO1001')
+        assert response.status_code == 200
+        assert response.headers['X-Replication-Seq'] == '1'
+        
+        response = client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        assert response.status_code == 403
+        
+        status = json.loads(client.get('/api/replication/status').data)['data']
+        assert status['role'] == 'follower'
+        assert status['lag_changes'] == 0
+    
+    def test_min_seq(self, client, replica):
+        """测试 read-your-writes：副本未追上 min_seq 时返回 503"""
+        assert client.get('/api/purchase/list?min_seq=1').status_code == 200
+        
+        response = client.get('/api/purchase/list', headers={'X-Min-Seq': '5'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        
+        assert client.get('/api/purchase/list?min_seq=abc').status_code == 400
+
+
+class TestJobs:
+    """后台报表任务接口测试"""
+    
+    @pytest.fixture(autouse=True)
+    def jobs(self, tmp_path, monkeypatch):
+        manager = JobManager(str(tmp_path / 'jobs'), max_workers=1)
+        monkeypatch.setattr(app_module, 'JOBS', manager)
+        monkeypatch.setattr(app_module, 'COLD', ColdStore(str(tmp_path / 'archive')))
+        yield manager
+        manager.shutdown()
+    
+    def test_submit_poll_download(self, client, jobs, sample_order_data):
+        """测试提交任务、查询状态并下载结果"""
+        client.post(
+            '/api/purchase/create',
+            data=json.dumps(sample_order_data),
+            content_type='application/json'
+        )
+        
+        response = client.post(
+            '/api/jobs',
+            data=json.dumps({'kind': 'export', 'params': {'category': '水果'}}),
+            content_type='application/json'
+        )
+        assert response.status_code == 202
+        job = json.loads(response.data)['data']
+        assert 'result_path' not in job
+        
+        jobs.wait(job['id'], timeout=30)
+        status = json.loads(client.get(f"/api/jobs/{job['id']}").data)['data']
+        assert status['status'] == 'succeeded'
+        assert status['rows'] == 1
+        
+        response = client.get(f"/api/jobs/{job['id']}/result")
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert ',测试供应商,苹果,' in response.data.decode('utf-8').splitlines()[1]
+    
+    def test_invalid_and_missing_job(self, client):
+        """测试不支持的报表类型与不存在的任务"""
+        response = client.post(
+            '/api/jobs',
+            data=json.dumps({'kind': 'unknown'}),
+            content_type='application/json'
+        )
+        assert response.status_code == 400
+        assert client.get('/api/jobs/nope').status_code == 404
+        assert client.delete('/api/jobs/nope').status_code == 404
+    
+    def test_limit(self, client, jobs):
+        """测试进行中的任务数达到上限时返回 429"""
+        jobs.max_active = 0
+        response = client.post(
+            '/api/jobs',
+            data=json.dumps({'kind': 'export'}),
+            content_type='application/json'
+        )
+        assert response.status_code == 429
+
+
+class TestImportOrders:
+    """批量导入测试"""
+    
+    @pytest.fixture(autouse=True)
+    def report_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(app.config, 'IMPORT_REPORT_DIR', str(tmp_path))
+    
+    def test_import_csv_upload(self, client):
+        """测试上传 CSV 导入，错误行写入报告"""
+        content = (
+            'supplier_name,product_name,quantity,unit_price,category,status,created_at\n'
+            '供应商A,苹果,10,5.5,水果,已完成,2023-01-05 08:00:00\n'
+            '供应商B,白菜,-1,2,蔬菜,,\n'
+            '供应商B,白菜,20,2,蔬菜,,\n'
+        ).encode('utf-8')
+        
+        response = client.post(
+            '/api/purchase/import',
+            data={'file': (io.BytesIO(content), 'orders.csv')},
+            content_type='multipart/form-data'
+        )
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        assert data['processed'] == 3
+        assert data['imported'] == 2
+        assert data['failed'] == 1
+        
+        orders = json.loads(client.get('/api/purchase/list').data)['data']['orders']
+        assert orders[0]['status'] == '已完成'
+        assert orders[0]['created_at'] == '2023-01-05 08:00:00'
+        assert orders[1]['status'] == '待审批'
+        assert client.get(f"/api/purchase/{orders[1]['id']}").status_code == 200
+        
+        report = client.get(data['report'])
+        assert report.status_code == 200
+        events = [json.loads(line) for line in report.data.decode('utf-8').splitlines()]
+        errors = [event for event in events if event['type'] == 'error']
+        assert len(errors) == 1
+        assert errors[0]['line'] == 3
+        assert events[-1]['type'] == 'summary'
+    
+    def test_import_ndjson_body(self, client, sample_order_data):
+        """测试以 NDJSON 请求体导入"""
+        lines = [json.dumps(sample_order_data), 'not json', json.dumps(sample_order_data)]
+        
+        response = client.post(
+            '/api/purchase/import?batch_size=1',
+            data='\n'.join(lines).encode('utf-8'),
+            content_type='application/x-ndjson'
+        )
+        
+        assert response.status_code == 200
+        data = json.loads(response.data)['data']
+        assert data['imported'] == 2
+        assert data['failed'] == 1
+    
+    def test_import_unknown_format(self, client):
+        """测试无法识别的文件格式"""
+        response = client.post(
+            '/api/purchase/import',
+            data=b'whatever',
+            content_type='application/octet-stream'
+        )
+        
+        assert response.status_code == 400
 
 
 if __name__ == '__main__':
@@ -0,0 +1,123 @@
+"""
+冷热分层单元测试
+使用 pytest 框架
+"""
+import pytest
+import sys
+import os
+import threading
+from datetime import datetime
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from archive import ColdStore, Segment, SegmentError, archive_orders, write_segment
+from store import MemoryStore, SqliteStore
+
+
+class TestSegment:
+    """段文件测试"""
+
+    def test_lookup_by_id(self, tmp_path, make_order):
+        """测试按采购单号二分查找"""
+        path = str(tmp_path / 'a.seg')
+        orders = [make_order(i) for i in range(1, 200)]
+        write_segment(path, orders)
+
+        segment = Segment(path)
+        assert segment.count == 199
+        assert segment.get('PO1001') == orders[0]
+        assert segment.get('PO1150') == orders[149]
+        assert segment.get('PO9999') is None
+        assert list(segment) == orders
+
+    def test_rejects_corrupted_file(self, tmp_path):
+        """测试无法识别的段文件"""
+        path = tmp_path / 'bad.seg'
+        path.write_bytes(b'x' * 64)
+        with pytest.raises(SegmentError):
+            Segment(str(path))
+
+
+class TestArchiveOrders:
+    """归档流程测试"""
+
+    def test_moves_only_old_final_orders(self, tmp_path, make_order):
+        """测试只归档终态且超过期限的采购单"""
+        store = MemoryStore()
+        store.create(make_order(1, status='已完成', created_at='2023-01-01 08:00:00'))
+        store.create(make_order(2, status='待审批', created_at='2023-01-01 08:00:00'))
+        store.create(make_order(3, status='已完成', created_at='2024-06-01 08:00:00'))
+        cold = ColdStore(str(tmp_path))
+
+        result = archive_orders(store, cold, max_age_days=30, now=datetime(2024, 6, 10))
+
+        assert result['archived'] == 1
+        assert store.count() == 2
+        assert store.get('PO1001') is None
+        assert cold.get('PO1001')['status'] == '已完成'
+        assert archive_orders(store, cold, max_age_days=30, now=datetime(2024, 6, 10))['archived'] == 0
+
+    def test_skips_orders_changed_during_archive(self, tmp_path, make_order):
+        """测试选出后被修改状态的采购单不删除、不归档"""
+        store = SqliteStore(str(tmp_path / 'purchase.db'))
+        store.create(make_order(1, status='已完成', created_at='2023-01-01 08:00:00'))
+        store.create(make_order(2, status='已完成', created_at='2023-01-01 08:00:00'))
+        cold = ColdStore(str(tmp_path / 'archive'))
+
+        def archivable(statuses, before, original=store.archivable):
+            orders = original(statuses, before)
+            store.update('PO1002', {'status': '待审批'})
+            return orders
+
+        store.archivable = archivable
+        result = archive_orders(store, cold, max_age_days=30, now=datetime(2024, 6, 10))
+
+        assert result['archived'] == 1
+        assert cold.get('PO1002') is None
+        assert store.get('PO1002')['status'] == '待审批'
+        assert [o['id'] for o in cold.list()] == ['PO1001']
+
+    def test_recovers_interrupted_archive(self, tmp_path, make_order):
+        """测试补发中断的归档：只发布已从热存储删除的采购单"""
+        store = MemoryStore()
+        store.create(make_order(1, created_at='2024-06-01 08:00:00'))
+        cold = ColdStore(str(tmp_path))
+        os.makedirs(cold.directory, exist_ok=True)
+        cold.stage([make_order(0), make_order(1)])
+
+        archive_orders(store, cold, max_age_days=30, now=datetime(2024, 6, 10))
+
+        assert [o['id'] for o in cold.list()] == ['PO1000']
+        assert not [name for name in os.listdir(cold.directory) if name.endswith('.pending')]
+
+    def test_concurrent_runs_are_serialized(self, tmp_path, make_order):
+        """测试归档持有文件锁，并发归档不会重复写段"""
+        store = MemoryStore()
+        store.create(make_order(1, status='已完成', created_at='2023-01-01 08:00:00'))
+        cold = ColdStore(str(tmp_path))
+        results = []
+
+        with cold.exclusive():
+            worker = threading.Thread(target=lambda: results.append(
+                archive_orders(store, ColdStore(str(tmp_path)), max_age_days=30, now=datetime(2024, 6, 10))))
+            worker.start()
+            worker.join(0.2)
+            assert worker.is_alive()
+        worker.join()
+
+        assert results[0]['archived'] == 1
+        assert archive_orders(store, cold, max_age_days=30, now=datetime(2024, 6, 10))['archived'] == 0
+        assert cold.count() == 1
+
+    def test_cold_store_sees_segments_from_other_writers(self, tmp_path, make_order):
+        """测试冷存储自动加载其他进程写入的新段"""
+        reader = ColdStore(str(tmp_path))
+        assert reader.count() == 0
+        ColdStore(str(tmp_path)).append([make_order(1), make_order(2, category='蔬菜')])
+        assert reader.count() == 2
+        assert [o['id'] for o in reader.list(category='水果')] == ['PO1001']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,88 @@
+"""
+批量导入单元测试
+使用 pytest 框架
+"""
+import pytest
+import io
+import json
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from importer import import_orders, main
+from store import SqliteStore
+
+
+def ndjson(records):
+    return io.BytesIO('\n'.join(json.dumps(r, ensure_ascii=False) for r in records).encode('utf-8'))
+
+
+def make_record(i):
+    return {
+        'supplier_name': f'供应商{i % 3}',
+        'product_name': '苹果',
+        'quantity': i + 1,
+        'unit_price': 2.5,
+        'category': '水果'
+    }
+
+
+class TestImportOrders:
+    """导入流程测试"""
+
+    def test_import_into_sqlite_in_batches(self, tmp_path):
+        """测试分批写入 SQLite，导入结束后索引恢复"""
+        store = SqliteStore(str(tmp_path / 'purchase.db'))
+        report_path = str(tmp_path / 'report.ndjson')
+
+        summary = import_orders(ndjson([make_record(i) for i in range(25)]), store, 'ndjson',
+                                batch_size=10, report_path=report_path, offline=True)
+
+        assert summary['imported'] == 25
+        assert store.count() == 25
+        assert store.get('PO1025')['quantity'] == 25
+        indexes = {row[0] for row in store.connection().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert set(SqliteStore.INDEXES) <= indexes
+
+        with open(report_path, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f]
+        assert [e['type'] for e in events] == ['progress', 'progress', 'progress', 'summary']
+
+    def test_online_import_keeps_indexes(self, tmp_path):
+        """测试服务运行期间导入不删除共享库的索引"""
+        store = SqliteStore(str(tmp_path / 'purchase.db'))
+        indexes = []
+
+        def bulk_insert(orders, original=store.bulk_insert):
+            indexes.append({row[0] for row in store.connection().execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'")})
+            return original(orders)
+
+        store.bulk_insert = bulk_insert
+        import_orders(ndjson([make_record(i) for i in range(5)]), store, 'ndjson', batch_size=2)
+
+        assert all(set(SqliteStore.INDEXES) <= names for names in indexes)
+
+    def test_rejects_non_string_fields(self, tmp_path):
+        """测试字段类型不正确的行计入失败"""
+        store = SqliteStore(str(tmp_path / 'purchase.db'))
+        records = [make_record(0), {**make_record(1), 'product_name': 1}, {**make_record(2), 'status': ['x']}]
+
+        summary = import_orders(ndjson(records), store, 'ndjson')
+
+        assert summary['imported'] == 1
+        assert summary['failed'] == 2
+
+    def test_cli_requires_shared_store(self, tmp_path):
+        """测试命令行导入必须指定共享存储"""
+        path = tmp_path / 'orders.ndjson'
+        path.write_text(json.dumps(make_record(0)), encoding='utf-8')
+        with pytest.raises(SystemExit):
+            main([str(path), '--store', 'memory://'])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,221 @@
+"""
+后台报表任务单元测试
+使用 pytest 框架
+"""
+import pytest
+import sys
+import os
+import io
+import json
+import subprocess
+from concurrent.futures import Future
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from archive import ColdStore
+from jobs import (
+    JobManager, JobRunner, JobError, JobLimitError, JobCancelled,
+    export_orders, price_history, run_report, spend_by_supplier, update_meta, write_json
+)
+from store import SqliteStore
+
+
+@pytest.fixture
+def orders(make_order):
+    common = {'quantity': 10, 'status': '已完成'}
+    return [
+        make_order(1, supplier_name='供应商A', unit_price=5.0, created_at='2024-01-01 08:00:00', **common),
+        make_order(2, supplier_name='供应商A', unit_price=7.0, created_at='2024-01-01 18:00:00', **common),
+        make_order(3, supplier_name='供应商B', unit_price=6.0, created_at='2024-01-02 08:00:00', **common),
+        make_order(4, supplier_name='供应商B', product_name='白菜', unit_price=2.0, category='蔬菜',
+                   created_at='2024-02-01 08:00:00', **common),
+    ]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    jobs = JobManager(str(tmp_path / 'jobs'), max_workers=1)
+    yield jobs
+    jobs.shutdown()
+
+
+class TestReports:
+    """报表生成测试"""
+
+    def test_spend_by_supplier(self, orders):
+        """测试供应商支出汇总与日期筛选"""
+        out = io.StringIO()
+        spend_by_supplier(orders, {'end': '2024-01'}, out)
+        result = json.loads(out.getvalue())
+        assert result['orders'] == 3
+        assert [item['supplier_name'] for item in result['suppliers']] == ['供应商A', '供应商B']
+        assert result['suppliers'][0]['total_amount'] == 120.0
+
+    def test_price_history(self, orders):
+        """测试按天汇总单价"""
+        out = io.StringIO()
+        price_history(orders, {'product_name': '苹果'}, out)
+        days = json.loads(out.getvalue())['products']['苹果']
+        assert days[0] == {'date': '2024-01-01', 'count': 2, 'avg': 6.0, 'min': 5.0, 'max': 7.0}
+        assert days[1]['date'] == '2024-01-02'
+
+    def test_export_orders(self, orders):
+        """测试按分类导出 CSV"""
+        out = io.StringIO()
+        rows = export_orders(orders, {'category': '蔬菜'}, out)
+        lines = out.getvalue().splitlines()
+        assert rows == 1
+        assert lines[0].startswith('id,')
+        assert lines[1].startswith('PO1004,')
+
+    def test_cancel_marker_stops_worker(self, tmp_path, orders):
+        """测试工作进程开始前已被取消"""
+        meta_path = str(tmp_path / 'job.json')
+        open(meta_path + '.cancel', 'w').close()
+        with pytest.raises(JobCancelled):
+            run_report(meta_path, 'export', {}, ('orders', orders), None, str(tmp_path / 'out.csv'))
+        assert not os.path.exists(tmp_path / 'out.csv')
+
+
+class TestJobManager:
+    """任务提交、缓存与取消测试"""
+
+    def test_submit_and_cache(self, manager, orders):
+        """测试任务完成后相同报表命中缓存"""
+        job = manager.submit('spend_by_supplier', {}, ('memory', lambda: orders))
+        assert job['status'] == 'queued'
+
+        job = manager.wait(job['id'], timeout=30)
+        assert job['status'] == 'succeeded'
+        assert job['rows'] == 2
+        with open(job['result_path'], encoding='utf-8') as f:
+            assert json.load(f)['orders'] == 4
+
+        cached = manager.submit('spend_by_supplier', {}, ('memory', lambda: orders))
+        assert cached['status'] == 'succeeded'
+        assert cached['cache_hit'] is True
+        assert manager.get(cached['id'])['result_path'] == job['result_path']
+
+        refreshed = manager.submit('spend_by_supplier', {}, ('memory', lambda: orders), refresh=True)
+        assert refreshed['cache_hit'] is False
+        assert manager.wait(refreshed['id'], timeout=30)['status'] == 'succeeded'
+
+    def test_reads_sqlite_and_cold_store(self, manager, tmp_path, make_order):
+        """测试工作进程直接读取 SQLite 与冷存储"""
+        store = SqliteStore(str(tmp_path / 'orders.db'))
+        store.create(make_order(1))
+        cold = ColdStore(str(tmp_path / 'archive'))
+        cold.append([make_order(0)])
+
+        job = manager.submit('export', {}, store.report_source(), archive_dir=cold.directory)
+        job = manager.wait(job['id'], timeout=30)
+        assert job['status'] == 'succeeded'
+        assert job['rows'] == 2
+
+    def test_unknown_kind(self, manager, orders):
+        """测试不支持的报表类型"""
+        with pytest.raises(JobError):
+            manager.submit('unknown', {}, ('memory', lambda: orders))
+
+    def test_active_limit(self, manager, orders):
+        """测试进行中的任务数上限"""
+        manager.max_active = 1
+        os.makedirs(manager.jobs_dir, exist_ok=True)
+        write_json(manager.meta_path('running1'), {
+            'id': 'running1', 'status': 'running', 'owner': os.getpid(), 'result_path': ''
+        })
+        with pytest.raises(JobLimitError):
+            manager.submit('export', {}, ('memory', lambda: orders))
+
+    def test_owner_exited(self, manager):
+        """测试提交任务的进程退出后任务标记为失败"""
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+        os.makedirs(manager.jobs_dir, exist_ok=True)
+        write_json(manager.meta_path('orphan1'), {
+            'id': 'orphan1', 'status': 'running', 'owner': child.pid, 'result_path': ''
+        })
+        assert manager.get('orphan1')['status'] == 'failed'
+
+    def test_cancel_finished_job(self, manager, orders):
+        """测试已结束的任务不能再取消，结果删除后标记为过期"""
+        job = manager.submit('export', {}, ('memory', lambda: orders))
+        job = manager.wait(job['id'], timeout=30)
+        assert manager.cancel(job['id'])['status'] == 'succeeded'
+
+        os.remove(job['result_path'])
+        assert manager.get(job['id'])['status'] == 'expired'
+        assert manager.get('../etc') is None
+
+
+
+class TestJobRunner:
+    """独立执行器测试（serve.py 模式：worker 只写入任务队列）"""
+
+    @pytest.fixture
+    def source(self, tmp_path, orders):
+        store = SqliteStore(str(tmp_path / 'orders.db'))
+        store.bulk_insert(orders)
+        return store.report_source()
+
+    def test_runner_executes_queued_jobs(self, tmp_path, source):
+        """测试任务写入磁盘队列后由执行器完成"""
+        submitter = JobManager(str(tmp_path), run_jobs=False)
+        job = submitter.submit('export', {}, source)
+        assert submitter.wait(job['id'], timeout=0.2)['status'] == 'queued'
+
+        runner = JobRunner(str(tmp_path), max_workers=1)
+        runner.start()
+        try:
+            job = submitter.wait(job['id'], timeout=30)
+        finally:
+            runner.shutdown()
+        assert job['status'] == 'succeeded'
+        assert job['rows'] == 4
+
+    def test_shutdown_requeues_pending_jobs(self, tmp_path, source):
+        """测试执行器停止时撤销的任务放回队列，由下一个执行器认领"""
+        submitter = JobManager(str(tmp_path), run_jobs=False)
+        job = submitter.submit('export', {}, source)
+        runner = JobRunner(str(tmp_path))
+        update_meta(submitter.meta_path(job['id']), owner=os.getpid())
+        future = Future()
+        future.cancel()
+        runner.finish(job['id'], future)
+
+        job = submitter.get(job['id'])
+        assert job['status'] == 'queued'
+        assert [queued['id'] for queued in runner.queued()] == [job['id']]
+
+    def test_cancel_unclaimed_job(self, tmp_path, source):
+        """测试尚未被执行器认领的任务直接取消"""
+        submitter = JobManager(str(tmp_path), run_jobs=False)
+        job = submitter.submit('export', {}, source)
+        assert submitter.cancel(job['id'])['status'] == 'cancelled'
+        assert JobRunner(str(tmp_path)).queued() == []
+
+    def test_memory_snapshot_taken_by_runner(self, manager, tmp_path, orders, monkeypatch):
+        """测试进程内存储的快照由执行器在认领时获取，其他进程的执行器不会认领"""
+        calls = []
+
+        def snapshot():
+            calls.append(1)
+            return orders
+
+        # 不启动后台线程，手动认领
+        monkeypatch.setattr(manager.runner, 'start', lambda: None)
+        job = manager.submit('export', {}, ('memory', snapshot))
+        assert calls == []
+        assert JobRunner(manager.directory).queued() == []
+
+        manager.runner.poll()
+        assert manager.wait(job['id'], timeout=30)['rows'] == 4
+        assert calls == [1]
+
+        with pytest.raises(JobError):
+            JobManager(str(tmp_path / 'other'), run_jobs=False).submit('export', {}, ('memory', snapshot))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
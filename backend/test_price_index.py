@@ -0,0 +1,83 @@
+"""
+单价滚动统计单元测试
+使用 pytest 框架
+"""
+import pytest
+import statistics
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from price_index import PriceStats, PriceIndex, check_price, EWMA_ALPHA
+
+
+class TestPriceStats:
+    """单个统计项测试"""
+
+    def test_welford_matches_statistics(self):
+        """测试 Welford 算法结果与逐项计算一致"""
+        prices = [5.5, 6.0, 4.8, 5.2, 7.1, 5.9]
+        stats = PriceStats()
+        for price in prices:
+            stats.observe(price)
+
+        assert stats.count == len(prices)
+        assert stats.mean == pytest.approx(statistics.mean(prices))
+        assert stats.variance == pytest.approx(statistics.variance(prices))
+        assert stats.min == 4.8
+        assert stats.max == 7.1
+        assert stats.last_price == 5.9
+
+    def test_ewma_follows_recent_prices(self):
+        """测试 EWMA 偏向近期单价"""
+        stats = PriceStats()
+        stats.observe(10.0)
+        stats.observe(20.0)
+        assert stats.ewma == pytest.approx(EWMA_ALPHA * 20 + (1 - EWMA_ALPHA) * 10)
+        assert stats.to_dict()['trend_pct'] < 0
+
+
+class TestPriceCheck:
+    """单价异常检测测试"""
+
+    def test_flags_outlier_only_with_enough_samples(self):
+        """测试样本足够时才标记偏离的单价"""
+        stats = PriceStats()
+        for price in [5.0, 5.2, 4.9, 5.1]:
+            stats.observe(price)
+        assert check_price(stats, 50.0) is None
+
+        stats.observe(5.0)
+        assert check_price(stats, 5.05) is None
+        alert = check_price(stats, 50.0)
+        assert alert['zscore'] > 3
+        assert alert['samples'] == 5
+
+    def test_constant_history(self):
+        """测试历史单价完全相同时不会零除"""
+        stats = PriceStats()
+        for _ in range(5):
+            stats.observe(5.0)
+        assert check_price(stats, 5.0) is None
+        assert check_price(stats, 8.0) is not None
+
+
+class TestPriceIndex:
+    """单价索引测试"""
+
+    def test_product_and_supplier_keys(self):
+        """测试同时维护供应商与产品整体统计"""
+        index = PriceIndex()
+        index.observe({'product_name': '苹果', 'supplier_name': 'A', 'unit_price': 5.0})
+        index.observe({'product_name': '苹果', 'supplier_name': 'B', 'unit_price': 7.0})
+
+        assert index.get('苹果').count == 2
+        assert index.get('苹果', 'A').mean == 5.0
+        assert list(index.supplier_stats('苹果')) == ['A', 'B']
+        assert index.get('香蕉') is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
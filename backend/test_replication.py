@@ -0,0 +1,113 @@
+"""
+只读副本单元测试
+使用 pytest 框架
+"""
+import pytest
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from replication import Follower, ReplicationError
+from store import SqliteStore
+
+
+@pytest.fixture
+def primary(tmp_path):
+    return SqliteStore(str(tmp_path / 'primary.db'), changelog=True)
+
+
+class TestFollower:
+    """副本追踪变更流测试"""
+
+    def test_bootstrap_copies_existing_data(self, primary, make_order):
+        """测试副本启动时复制已有采购单与单价统计"""
+        primary.create(make_order(unit_price=4.0))
+        primary.create(make_order(unit_price=6.0))
+
+        follower = Follower(primary.path)
+        follower.bootstrap()
+
+        assert follower.applied_seq == primary.head_seq() == 2
+        assert follower.store.get('PO1002')['unit_price'] == 6.0
+        assert follower.store.price_stats('苹果').mean == 5.0
+
+    def test_report_source_reads_primary_file(self, primary):
+        """测试副本上的报表任务直接读取主节点数据库文件"""
+        follower = Follower(primary.path)
+        assert follower.report_source() == ('sqlite', primary.path)
+
+    def test_applies_changes_in_order(self, primary, make_order):
+        """测试副本按顺序应用创建、批量导入、更新与删除"""
+        follower = Follower(primary.path)
+        follower.bootstrap()
+
+        order = primary.create(make_order())
+        primary.bulk_insert([make_order(product_name='香蕉'), make_order(product_name='白菜', category='蔬菜')])
+        primary.update(order['id'], {'status': '已完成'})
+        primary.remove(['PO1002'])
+        assert follower.status()['applied_seq'] == 0
+
+        assert follower.poll() == 5
+        assert follower.applied_seq == primary.head_seq()
+        assert follower.store.get(order['id'])['status'] == '已完成'
+        assert follower.store.get('PO1002') is None
+        assert [o['product_name'] for o in follower.store.list()] == ['苹果', '白菜']
+        assert follower.store.price_stats('香蕉').count == 1
+        assert follower.status()['lag_changes'] == 0
+
+    def test_consecutive_deletes_applied_in_one_batch(self, primary, make_order):
+        """测试连续的删除合并为一次 remove"""
+        follower = Follower(primary.path)
+        follower.bootstrap()
+        orders = [primary.create(make_order()) for _ in range(3)]
+        primary.remove([order['id'] for order in orders[:2]])
+        primary.update(orders[2]['id'], {'status': '已完成'})
+
+        calls = []
+        remove = follower.store.remove
+        follower.store.remove = lambda order_ids, **kwargs: calls.append(list(order_ids)) or remove(order_ids, **kwargs)
+
+        follower.poll()
+
+        assert calls == [[orders[0]['id'], orders[1]['id']]]
+        assert [o['id'] for o in follower.store.list()] == [orders[2]['id']]
+        assert follower.store.count() == 1
+        assert [o['id'] for o in follower.store.list(sort='quantity')] == [orders[2]['id']]
+
+    def test_rebootstraps_after_changes_pruned(self, primary, make_order):
+        """测试需要的变更已被主节点清理时重新复制快照"""
+        follower = Follower(primary.path)
+        follower.bootstrap()
+        for _ in range(3):
+            primary.create(make_order())
+        primary.prune_changes(primary.connection(), retention=1)
+        assert primary.connection().execute('SELECT COUNT(*) FROM changes').fetchone()[0] == 1
+
+        follower.poll()
+
+        assert follower.store.count() == 3
+        assert follower.applied_seq == primary.head_seq()
+        assert follower.store.price_stats('苹果').count == 3
+
+    def test_wait_for_min_seq(self, primary, make_order):
+        """测试等待副本追上指定序号"""
+        follower = Follower(primary.path, poll_interval=0.01).start()
+        try:
+            primary.create(make_order())
+            assert follower.wait_for(primary.head_seq(), timeout=2.0)
+            assert follower.store.count() == 1
+            assert not follower.wait_for(primary.head_seq() + 100, timeout=0.05)
+        finally:
+            follower.stop()
+
+    def test_requires_changelog(self, tmp_path):
+        """测试主节点未开启变更流时无法启动副本"""
+        store = SqliteStore(str(tmp_path / 'plain.db'))
+        with pytest.raises(ReplicationError):
+            Follower(store.path).bootstrap()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,177 @@
+"""
+存储层单元测试
+使用 pytest 框架
+"""
+import pytest
+import sys
+import os
+
+# 添加后端路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+from store import MemoryStore, SqliteStore, create_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    """分别对两种存储实现运行同一组测试"""
+    if request.param == 'memory':
+        return MemoryStore()
+    return SqliteStore(str(tmp_path / 'purchase.db'))
+
+
+class TestStore:
+    """存储接口测试"""
+
+    def test_create_assigns_sequential_ids(self, store, make_order):
+        """测试采购单号按顺序分配"""
+        first = store.create(make_order())
+        second = store.create(make_order())
+        assert first['id'] == 'PO1001'
+        assert second['id'] == 'PO1002'
+        assert store.count() == 2
+
+    def test_get_and_update(self, store, make_order):
+        """测试按单号查询与更新"""
+        order = store.create(make_order())
+        updated = store.update(order['id'], {'status': '已批准', 'quantity': 1})
+        assert updated['status'] == '已批准'
+        assert updated['quantity'] == 100
+        assert store.get(order['id'])['status'] == '已批准'
+        assert store.get('PO99999') is None
+        assert store.update('PO99999', {'status': '已批准'}) is None
+
+    def test_list_filters_keep_insertion_order(self, store, make_order):
+        """测试筛选结果保持插入顺序"""
+        store.create(make_order(product_name='苹果'))
+        store.create(make_order(product_name='白菜', category='蔬菜'))
+        store.create(make_order(product_name='香蕉'))
+        orders = store.list(category='水果')
+        assert [o['product_name'] for o in orders] == ['苹果', '香蕉']
+        assert len(store.list(category='水果', status='已批准')) == 0
+
+    def test_sorted_top_k(self, store, make_order):
+        """测试按字段排序取前 k 条，可叠加筛选，相同值保持插入顺序"""
+        amounts = [30.0, 10.0, 50.0, 20.0, 50.0, 40.0]
+        orders = [
+            store.create(make_order(total_amount=amount, category='水果' if i % 2 else '蔬菜'))
+            for i, amount in enumerate(amounts)
+        ]
+
+        top = store.list(sort='total_amount', descending=True, limit=3)
+        assert [o['id'] for o in top] == [orders[4]['id'], orders[2]['id'], orders[5]['id']]
+
+        lowest = store.list(sort='total_amount', limit=2)
+        assert [o['total_amount'] for o in lowest] == [10.0, 20.0]
+
+        fruit = store.list(category='水果', sort='total_amount', descending=True, limit=2)
+        assert [o['total_amount'] for o in fruit] == [40.0, 20.0]
+        assert store.count(category='水果') == 3
+        assert len(store.list(sort='total_amount')) == 6
+
+        with pytest.raises(ValueError):
+            store.list(sort='remark')
+
+    def test_sorted_index_follows_updates(self, store, make_order):
+        """测试更新状态与删除后有序索引保持一致"""
+        small = store.create(make_order(quantity=1))
+        large = store.create(make_order(quantity=9))
+        store.update(large['id'], {'status': '已批准'})
+
+        pending = store.list(status='待审批', sort='quantity', descending=True, limit=5)
+        assert [o['id'] for o in pending] == [small['id']]
+        approved = store.list(status='已批准', sort='quantity', limit=5)
+        assert [o['id'] for o in approved] == [large['id']]
+        assert store.count(status='已批准') == 1
+
+        store.remove([large['id']])
+        assert [o['id'] for o in store.list(sort='quantity', descending=True)] == [small['id']]
+
+    def test_online_bulk_load_indexes_after_load(self, store, make_order):
+        """测试在线批量导入期间可按单号查询与修改，结束后有序索引完整且不重复"""
+        existing = store.create(make_order(quantity=5))
+        with store.bulk_load(drop_indexes=False):
+            first = store.bulk_insert([make_order(quantity=q) for q in (3, 8)])
+            second = store.bulk_insert([make_order(quantity=q) for q in (1, 6)])
+            assert first == second == 2
+            assert store.get('PO1002')['quantity'] == 3
+            store.update('PO1002', {'status': '已批准'})
+            store.remove(['PO1004'])
+
+        ranked = store.list(sort='quantity', descending=True)
+        assert [o['id'] for o in ranked] == ['PO1003', 'PO1005', existing['id'], 'PO1002']
+        assert [o['id'] for o in store.list(status='已批准', sort='quantity')] == ['PO1002']
+        assert store.count(status='待审批') == 3
+
+    def test_invalid_price_keys_leave_store_unchanged(self, store, make_order):
+        """测试统计键不合法时不保存采购单"""
+        with pytest.raises(Exception):
+            store.create(make_order(supplier_name={'x': 1}))
+        with pytest.raises(Exception):
+            store.bulk_insert([make_order(), make_order(product_name=['苹果'])])
+        assert store.count() == 0
+        assert store.price_stats('苹果') is None
+        assert store.create(make_order())['id'] == 'PO1001'
+
+    def test_invalid_bucket_keys_leave_store_unchanged(self, store, make_order):
+        """测试分类或状态不合法时创建、更新都不改动已有数据"""
+        with pytest.raises(Exception):
+            store.create(make_order(category=['水果']))
+        with pytest.raises(Exception):
+            store.bulk_insert([make_order(), make_order(status={'x': 1})])
+        assert store.count() == 0
+        assert store.price_stats('苹果') is None
+
+        order = store.create(make_order())
+        with pytest.raises(Exception):
+            store.update(order['id'], {'status': ['x'], 'remark': '改了'})
+        assert store.get(order['id'])['status'] == '待审批'
+        assert store.get(order['id'])['remark'] == ''
+        assert [o['id'] for o in store.list(status='待审批', sort='unit_price')] == [order['id']]
+
+    def test_record_prices(self, store, make_order):
+        """测试单价统计按产品与供应商累计"""
+        store.record_prices([
+            make_order(supplier_name='A', unit_price=4.0),
+            make_order(supplier_name='A', unit_price=6.0),
+            make_order(supplier_name='B', unit_price=8.0),
+        ])
+        assert store.price_stats('苹果').count == 3
+        assert store.price_stats('苹果').mean == 6.0
+        assert store.price_stats('苹果', 'A').variance == 2.0
+        assert list(store.supplier_price_stats('苹果')) == ['A', 'B']
+        assert store.price_stats('香蕉') is None
+
+    def test_archivable_and_remove(self, store, make_order):
+        """测试筛选可归档采购单并从热存储删除"""
+        old = store.create(make_order(status='已完成', created_at='2023-01-01 08:00:00'))
+        store.create(make_order(status='待审批', created_at='2023-01-01 08:00:00'))
+        store.create(make_order(status='已完成', created_at='2024-06-01 08:00:00'))
+
+        orders = store.archivable(('已完成',), '2024-01-01 00:00:00')
+        assert [o['id'] for o in orders] == [old['id']]
+
+        store.remove([old['id']])
+        assert store.get(old['id']) is None
+        assert store.count() == 2
+
+
+class TestSharedStore:
+    """共享存储测试"""
+
+    def test_sqlite_store_shared_between_instances(self, tmp_path, make_order):
+        """测试两个实例（模拟两个 worker）看到同一份数据"""
+        url = 'sqlite:///' + str(tmp_path / 'purchase.db')
+        writer = create_store(url)
+        reader = create_store(url)
+        order = writer.create(make_order())
+        assert reader.get(order['id'])['product_name'] == '苹果'
+
+    def test_create_store_rejects_unknown_url(self):
+        """测试不支持的存储地址"""
+        with pytest.raises(ValueError):
+            create_store('redis://localhost')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,237 @@
+"""
+请求耗时分析
+
+每个响应附带:
+- X-Request-ID: 请求编号（沿用调用方传入的合法编号，否则自动生成）
+- Server-Timing: 各阶段耗时（parse / validate / store / serialize / total，单位毫秒），
+  浏览器开发者工具 Network 面板可直接查看
+
+同样的数据以 JSON 行写入访问日志（配置 ACCESS_LOG 后开启）。
+
+计时在 WSGI 层完成：直接读 environ、向响应头列表追加元组，不经过 flask.request / g 代理与 Headers 对象。
+请求期间只记录整数纳秒；Server-Timing 由整数微秒拼接（小数部分查表），不做浮点格式化；
+访问日志只缓存原始记录，写出时才格式化（整数微秒），攒够一批、或距上次写出超过 1 秒时一次 os.write 写出。
+"""
+import atexit
+import itertools
+import json
+import os
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from time import perf_counter_ns
+
+from flask.json.provider import DefaultJSONProvider
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_ENVIRON = 'HTTP_X_REQUEST_ID'
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._\-]{1,64}')
+TIMING_ALLOW_ORIGIN = ('Timing-Allow-Origin', '*')
+
+# 当前请求的阶段耗时（阶段名 -> 纳秒）；phase 退出时直接读取，避免每次经过 flask.g 代理查找
+_current_phases = ContextVar('request_phases', default=None)
+
+# 请求编号：进程随机前缀 + 自增序号，生成成本远低于 uuid
+_request_prefix = None
+_request_counter = itertools.count(1)
+
+
+def next_request_id():
+    global _request_prefix
+    if _request_prefix is None:
+        _request_prefix = os.urandom(4).hex() + '-'
+    return _request_prefix + str(next(_request_counter))
+
+
+class _Phase:
+    """phase 的实例，按阶段名缓存复用：开始时先减去开始时刻，结束时加上结束时刻，自身不保存状态"""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        phases = _current_phases.get()
+        if phases is not None:
+            phases[self.name] = phases.get(self.name, 0) - perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        phases = _current_phases.get()
+        if phases is not None:
+            phases[self.name] += perf_counter_ns()
+        return False
+
+
+_phases_by_name = {}
+
+
+def phase(name):
+    """
+    统计一段代码的耗时，计入当前请求的 Server-Timing
+        with phase('store'):
+            orders = STORE.list()
+    同名阶段多次出现（包括嵌套）时累加
+    """
+    instance = _phases_by_name.get(name)
+    if instance is None:
+        instance = _phases_by_name[name] = _Phase(name)
+    return instance
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON 解析计入 parse 阶段，生成 JSON 响应计入 serialize 阶段"""
+
+    def loads(self, s, **kwargs):
+        with phase('parse'):
+            return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with phase('serialize'):
+            return super().response(*args, **kwargs)
+
+
+class AccessLog:
+    """
+    JSON 行访问日志
+    请求期间只把原始记录（整数纳秒）放入队列；攒够 batch_size 条、或距上次写出超过 flush_interval 秒时统一格式化，
+    一次 os.write 追加写入（O_APPEND），多个 worker 进程写同一个文件也不会交错。
+    写出时从队列逐条取出，多线程服务器并发写入、写出不会丢记录。
+    空闲期间的积压由 flush_if_stale 写出（serve.py 的 worker 每秒调用），进程退出前调用 flush。
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval_ns = int(flush_interval * 1e9)
+        self.fd = None
+        self.pending = deque()
+        self.last_flush = perf_counter_ns()
+        self.escaped_paths = {}
+
+    def write(self, record):
+        """record: (结束时刻 perf_counter_ns, request_id, method, path, status 行, total_ns, phases)"""
+        self.pending.append(record)
+        if len(self.pending) >= self.batch_size or record[0] - self.last_flush >= self.flush_interval_ns:
+            self.flush()
+
+    def flush_if_stale(self):
+        if self.pending and perf_counter_ns() - self.last_flush >= self.flush_interval_ns:
+            self.flush()
+
+    def flush(self):
+        now = self.last_flush = perf_counter_ns()
+        if not self.pending:
+            return
+        if self.fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # 墙上时间由写出时刻换算，请求期间不调用 time.time
+        wall_ms = time.time_ns() // 1000000
+        pid = os.getpid()
+        lines = []
+        for _ in range(len(self.pending)):
+            end, request_id, method, path, status, total, phases = self.pending.popleft()
+            # 请求编号已按 REQUEST_ID_PATTERN 校验，method 与阶段名为固定标识，只有 path 需要转义
+            escaped = self.escaped_paths.get(path)
+            if escaped is None:
+                if len(self.escaped_paths) >= 4096:
+                    self.escaped_paths.clear()
+                # WSGI 的 PATH_INFO 为按 latin-1 解码的原始字节
+                escaped = self.escaped_paths[path] = json.dumps(
+                    path.encode('latin-1').decode('utf-8', 'replace'), ensure_ascii=False)
+            phase_items = ','.join(f'"{name}":{elapsed // 1000}' for name, elapsed in phases.items())
+            lines.append(
+                f'{{"ts_ms":{wall_ms - (now - end) // 1000000},"request_id":"{request_id}","pid":{pid},'
+                f'"method":"{method}","path":{escaped},"status":{status[:3]},'
+                f'"total_us":{total // 1000},"phases_us":{{{phase_items}}}}}\n'
+            )
+        os.write(self.fd, ''.join(lines).encode('utf-8'))
+
+    def close(self):
+        self.flush()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+_access_logs = {}
+
+
+def get_access_log(path):
+    log = _access_logs.get(path)
+    if log is None:
+        log = _access_logs[path] = AccessLog(path)
+    return log
+
+
+def flush_access_logs(stale_only=False):
+    """写出缓存的访问日志；stale_only 时只写出超过刷新间隔的（空闲时定期调用）"""
+    for log in _access_logs.values():
+        if stale_only:
+            log.flush_if_stale()
+        else:
+            log.flush()
+
+
+atexit.register(flush_access_logs)
+
+# 毫秒的三位小数部分，查表代替 %03d 补零
+_MICROSECOND_DIGITS = tuple(f'{i:03d}' for i in range(1000))
+
+
+def format_server_timing(phases, total):
+    """各阶段与总耗时（纳秒）格式化为 Server-Timing，单位毫秒，精确到微秒；只做整数运算"""
+    header = ''
+    for name, elapsed in phases.items():
+        ms, us = divmod(elapsed // 1000, 1000)
+        header += f'{name};dur={ms}.{_MICROSECOND_DIGITS[us]}, '
+    ms, us = divmod(total // 1000, 1000)
+    return f'{header}total;dur={ms}.{_MICROSECOND_DIGITS[us]}'
+
+
+class TimingMiddleware:
+    """包装 app.wsgi_app，在 start_response 时追加计时响应头并记录访问日志"""
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+
+    def __call__(self, environ, start_response):
+        start = perf_counter_ns()
+        request_id = environ.get(REQUEST_ID_ENVIRON)
+        if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = next_request_id()
+        phases = {}
+        token = _current_phases.set(phases)
+
+        def timed_start_response(status, headers, exc_info=None):
+            end = perf_counter_ns()
+            headers.append((REQUEST_ID_HEADER, request_id))
+            headers.append(('Server-Timing', format_server_timing(phases, end - start)))
+            # 跨域页面（前端 8000 端口）的开发者工具需要该头才能显示 Server-Timing
+            headers.append(TIMING_ALLOW_ORIGIN)
+            path = self.config.get('ACCESS_LOG')
+            if path:
+                get_access_log(path).write((
+                    end, request_id, environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'),
+                    status, end - start, phases
+                ))
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, timed_start_response)
+        finally:
+            _current_phases.reset(token)
+
+
+def init_app(app):
+    """
+    注册计时中间件
+    app.config['ACCESS_LOG']: 访问日志路径，为空时不写日志
+    """
+    app.json = TimedJSONProvider(app)
+    app.config.setdefault('ACCESS_LOG', os.environ.get('PURCHASE_ACCESS_LOG') or None)
+    app.wsgi_app = TimingMiddleware(app.wsgi_app, app.config)
@@ -0,0 +1,91 @@
+"""
+采购单数据校验
+创建接口与批量导入共用同一套校验规则
+"""
+import math
+from datetime import datetime
+
+REQUIRED_FIELDS = ['supplier_name', 'product_name', 'quantity', 'unit_price', 'category']
+# 必须为字符串的字段：用作单价统计、有序索引分桶的键
+STRING_FIELDS = ['supplier_name', 'product_name', 'category']
+# 更新接口可修改的字段，均为字符串
+UPDATE_FIELDS = ['status', 'remark']
+DEFAULT_STATUS = '待审批'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ValidationError(ValueError):
+    """采购单数据不合法，message 可直接返回给调用方"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def build_order(data, allow_history=False, now=None):
+    """
+    校验请求数据并生成待保存的采购单（不含采购单号）
+    allow_history: 是否允许携带 status / created_at（导入历史采购单时使用）
+    """
+    if not data:
+        raise ValidationError('请求体不能为空')
+
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
+    if missing_fields:
+        raise ValidationError(f'缺少必需字段: {", ".join(missing_fields)}')
+
+    invalid_fields = [field for field in STRING_FIELDS if not isinstance(data[field], str)]
+    if allow_history and data.get('status') and not isinstance(data['status'], str):
+        invalid_fields.append('status')
+    if invalid_fields:
+        raise ValidationError(f'参数验证失败: {", ".join(invalid_fields)} 必须是字符串')
+
+    try:
+        quantity = int(data['quantity'])
+        unit_price = float(data['unit_price'])
+
+        if quantity <= 0:
+            raise ValueError('数量必须大于0')
+        # nan / inf 能通过大小比较，写入后会让该产品的单价统计永久变为 nan
+        if not math.isfinite(unit_price) or not math.isfinite(quantity * unit_price):
+            raise ValueError('单价必须是有限数值')
+        if unit_price < 0:
+            raise ValueError('单价不能为负数')
+
+        created_at = None
+        if allow_history and data.get('created_at'):
+            created_at = datetime.strptime(data['created_at'], DATETIME_FORMAT).strftime(DATETIME_FORMAT)
+    except (ValueError, TypeError, OverflowError) as e:
+        raise ValidationError(f'参数验证失败: {str(e)}')
+
+    if created_at is None:
+        created_at = (now or datetime.now()).strftime(DATETIME_FORMAT)
+    status = data.get('status') if allow_history and data.get('status') else DEFAULT_STATUS
+
+    return {
+        'supplier_name': data['supplier_name'],
+        'product_name': data['product_name'],
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'total_amount': round(quantity * unit_price, 2),
+        'category': data['category'],
+        'status': status,
+        'created_at': created_at,
+        'created_by': data.get('created_by') or '系统',
+        'remark': data.get('remark') or ''
+    }
+
+
+def validate_changes(data):
+    """
+    校验更新请求数据，返回要修改的字段
+    状态用作有序索引分桶的键，必须在修改存储之前确认是字符串
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('请求体必须是 JSON 对象')
+
+    invalid_fields = [field for field in UPDATE_FIELDS if field in data and not isinstance(data[field], str)]
+    if invalid_fields:
+        raise ValidationError(f'参数验证失败: {", ".join(invalid_fields)} 必须是字符串')
+
+    return {field: data[field] for field in UPDATE_FIELDS if field in data}
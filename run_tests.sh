@@ -23,7 +23,7 @@ echo "运行后端单元测试"
 echo "================================"
 cd backend
 echo "测试接口功能..."
-python -m pytest test_api.py -v --tb=short
+python -m pytest test_api.py test_store.py test_importer.py test_price_index.py test_archive.py test_replication.py test_jobs.py -v --tb=short
 
 echo ""
 echo "================================"